@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, session, send_file
+from flask import Flask, request, jsonify, session, send_file, Response, stream_with_context
 from flask_cors import CORS
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 import os
@@ -12,11 +12,15 @@ import secrets
 from auth import authenticate_user, get_user_role, hash_password
 from upload import process_upload, convert_pdf_to_images
 from chaotic import scramble_image, unscramble_image, generate_chaos_key
-from hashing import compute_sha256, verify_integrity
-from phe_wrapper import encrypt_metadata, decrypt_metadata, increment_counter
+from hashing import compute_sha256
+from phe_wrapper import encrypt_metadata, decrypt_metadata, increment_counter, start_obfuscator_pool
 from timelock import check_release_time, schedule_release
-from logs import append_log, verify_log_chain
+from logs import (append_log, get_logs_page, iter_logs, count_log_entries, get_log_statistics,
+                  verify_log_chain, iter_export, EXPORT_FORMATS, EXPORT_COMPRESSIONS)
 from examcenter import download_scrambled_paper, decrypt_paper
+from scrubber import start_scrubber, scrub_exam, get_scrub_result
+from merkle import get_signed_tree_head, get_inclusion_proof, get_consistency_proof
+import logstore
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(32)
@@ -51,11 +55,15 @@ def load_user(user_id):
 # Configuration
 UPLOAD_FOLDER = '../papers'
 USERS_FILE = '../users/users.json'
-LOGS_FILE = '../logs/logs.json'
 CONFIG_FILE = '../config/system_config.json'
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['SCRUB_BYTES_PER_SECOND'] = 8 * 1024 * 1024  # Background integrity I/O budget
+app.config['SCRUB_INTERVAL'] = 15 * 60  # Seconds between background scrub passes
+app.config['LOG_PAGE_SIZE'] = 50  # Default page size of the admin logs API
+app.config['LOG_PAGE_MAX'] = 1000  # Largest page the admin logs API returns
+app.config['PHE_OBFUSCATOR_POOL_SIZE'] = 64  # Precomputed Paillier obfuscators (0 disables the pool)
 
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -73,6 +81,15 @@ if os.path.exists(poppler_path):
                 os.environ['PATH'] = root + os.pathsep + current_path
             break
 
+@app.before_request
+def start_background_tasks():
+    """Start background workers with the first request, not at import (no-op once running)"""
+    # Continuously re-verify page hashes in the background
+    start_scrubber(UPLOAD_FOLDER, app.config['SCRUB_BYTES_PER_SECOND'], app.config['SCRUB_INTERVAL'])
+    
+    # Precompute Paillier obfuscators while requests are idle
+    start_obfuscator_pool(app.config['PHE_OBFUSCATOR_POOL_SIZE'])
+
 @app.route('/api/login', methods=['POST'])
 def login():
     """User authentication endpoint"""
@@ -89,8 +106,8 @@ def login():
             user = User(username, user_data['role'])
             login_user(user)
             
-            # Log the login event
-            append_log('login', username, None, f"User {username} logged in")
+            # Log the login event (fire-and-forget: written with the next group commit)
+            append_log('login', username, None, f"User {username} logged in", wait=False)
             
             return jsonify({
                 'success': True,
@@ -108,7 +125,7 @@ def login():
 def logout():
     """User logout endpoint"""
     username = current_user.username
-    append_log('logout', username, None, f"User {username} logged out")
+    append_log('logout', username, None, f"User {username} logged out", wait=False)
     logout_user()
     return jsonify({'success': True})
 
@@ -229,11 +246,19 @@ def admin_verify_integrity(exam_id):
         if current_user.role != 'admin':
             return jsonify({'error': 'Unauthorized'}), 403
         
-        result = verify_integrity(exam_id, app.config['UPLOAD_FOLDER'])
+        # Serve the latest background scrub result unless a fresh check is forced
+        force = request.args.get('force', 'false').lower() in ('1', 'true', 'yes')
+        result = None if force else get_scrub_result(exam_id)
+        
+        if result:
+            result = dict(result, source='scrubber')
+        else:
+            result = scrub_exam(exam_id, app.config['UPLOAD_FOLDER'])
+            result = dict(result, source='fresh')
         
         # Log the verification
         append_log('verify', current_user.username, exam_id,
-                  f"Integrity verification for exam {exam_id}: {'PASSED' if result['valid'] else 'FAILED'}")
+                  f"Integrity verification for exam {exam_id}: {'PASSED' if result['valid'] else 'FAILED'} ({result['source']})")
         
         return jsonify(result)
         
@@ -243,25 +268,209 @@ def admin_verify_integrity(exam_id):
 @app.route('/api/admin/logs', methods=['GET'])
 @login_required
 def admin_get_logs():
-    """Admin endpoint to view tamper-proof logs"""
+    """Admin endpoint to page through tamper-proof logs
+    
+    Query parameters: limit, after (next_cursor of the previous page),
+    order (newest|oldest), event, exam_id, user.
+    """
     try:
         if current_user.role != 'admin':
             return jsonify({'error': 'Unauthorized'}), 403
         
-        if os.path.exists(LOGS_FILE):
-            with open(LOGS_FILE, 'r') as f:
-                logs = json.load(f)
-            
-            # Verify log chain integrity
-            chain_valid = verify_log_chain(logs)
-            
-            return jsonify({
-                'logs': logs,
-                'chain_valid': chain_valid
-            })
-        else:
-            return jsonify({'logs': [], 'chain_valid': True})
-            
+        order = request.args.get('order', 'newest')
+        if order not in ('newest', 'oldest'):
+            return jsonify({'error': "order must be 'newest' or 'oldest'"}), 400
+        
+        try:
+            limit = int(request.args.get('limit', app.config['LOG_PAGE_SIZE']))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        limit = max(1, min(limit, app.config['LOG_PAGE_MAX']))
+        
+        result = get_logs_page(
+            limit=limit,
+            after=request.args.get('after'),
+            order=order,
+            event_filter=request.args.get('event'),
+            user_filter=request.args.get('user'),
+            exam_filter=request.args.get('exam_id')
+        )
+        
+        if not result['success']:
+            return jsonify({'error': result['error']}), 400
+        
+        # Verify entries appended since the last verification, or the
+        # whole chain when explicitly requested
+        full = request.args.get('full', 'false').lower() in ('1', 'true', 'yes')
+        chain_valid = verify_log_chain(full=full)
+        
+        return jsonify({
+            'logs': result['logs'],
+            'next_cursor': result['next_cursor'],
+            'total_entries': count_log_entries(),
+            'chain_valid': chain_valid
+        })
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/logs/stats', methods=['GET'])
+@login_required
+def admin_log_statistics():
+    """Admin endpoint for log statistics (?recompute=true rescans and verifies)"""
+    try:
+        if current_user.role != 'admin':
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        recompute = request.args.get('recompute', 'false').lower() in ('1', 'true', 'yes')
+        stats = get_log_statistics(recompute=recompute)
+        
+        if 'error' in stats:
+            return jsonify(stats), 500
+        
+        return jsonify(stats)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/logs/stream', methods=['GET'])
+@login_required
+def admin_stream_logs():
+    """Admin endpoint streaming matching logs as NDJSON, oldest first
+    
+    Query parameters: event, exam_id, user, since, until (ISO timestamps).
+    """
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    logs = iter_logs(
+        event_filter=request.args.get('event'),
+        user_filter=request.args.get('user'),
+        exam_filter=request.args.get('exam_id'),
+        since=request.args.get('since'),
+        until=request.args.get('until')
+    )
+    
+    def generate():
+        for log in logs:
+            yield json.dumps(log) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/admin/logs/export', methods=['GET'])
+@login_required
+def admin_export_logs():
+    """Admin endpoint streaming a log export as a file download
+    
+    Query parameters: format (jsonl|csv|json), compression (gzip|xz),
+    since, until (ISO timestamps), exam_id.
+    """
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    export_format = request.args.get('format', 'jsonl').lower()
+    compression = request.args.get('compression') or None
+    
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    if compression and compression not in EXPORT_COMPRESSIONS:
+        return jsonify({'error': f"compression must be one of {', '.join(EXPORT_COMPRESSIONS)}"}), 400
+    
+    filename = f"edusecure_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    mimetype = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv', 'json': 'application/json'}[export_format]
+    if compression == 'gzip':
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    elif compression == 'xz':
+        filename += '.xz'
+        mimetype = 'application/x-xz'
+    
+    export = iter_export(
+        export_format=export_format,
+        compression=compression,
+        since=request.args.get('since'),
+        until=request.args.get('until'),
+        exam_id=request.args.get('exam_id')
+    )
+    
+    return Response(
+        stream_with_context(export),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+def int_arg(name):
+    """Read an optional integer query parameter (ValueError if malformed)"""
+    value = request.args.get(name)
+    return int(value) if value else None
+
+@app.route('/api/admin/logs/tree_head', methods=['GET'])
+@login_required
+def admin_log_tree_head():
+    """Admin endpoint for the signed Merkle tree head of a log chain (?exam_id=)"""
+    try:
+        if current_user.role != 'admin':
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        chain = logstore.chain_for(request.args.get('exam_id'))
+        return jsonify(get_signed_tree_head(chain))
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/logs/proof/inclusion', methods=['GET'])
+@login_required
+def admin_log_inclusion_proof():
+    """Admin endpoint proving an entry is in a log chain (?id=&exam_id=&tree_size=)"""
+    try:
+        if current_user.role != 'admin':
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        try:
+            entry_id = int_arg('id')
+            size = int_arg('tree_size')
+        except ValueError:
+            return jsonify({'error': 'id and tree_size must be integers'}), 400
+        
+        if entry_id is None:
+            return jsonify({'error': 'Entry id required'}), 400
+        
+        chain = logstore.chain_for(request.args.get('exam_id'))
+        result = get_inclusion_proof(chain, entry_id, size)
+        
+        if not result['success']:
+            return jsonify({'error': result['error']}), 400
+        
+        return jsonify(result)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/logs/proof/consistency', methods=['GET'])
+@login_required
+def admin_log_consistency_proof():
+    """Admin endpoint proving a log chain extends an earlier tree (?first=&second=&exam_id=)"""
+    try:
+        if current_user.role != 'admin':
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        try:
+            first_size = int_arg('first')
+            second_size = int_arg('second')
+        except ValueError:
+            return jsonify({'error': 'first and second must be integers'}), 400
+        
+        if first_size is None:
+            return jsonify({'error': 'First tree size required'}), 400
+        
+        chain = logstore.chain_for(request.args.get('exam_id'))
+        result = get_consistency_proof(chain, first_size, second_size)
+        
+        if not result['success']:
+            return jsonify({'error': result['error']}), 400
+        
+        return jsonify(result)
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -307,9 +516,9 @@ def examcenter_download(exam_id):
         result = download_scrambled_paper(exam_id, app.config['UPLOAD_FOLDER'])
         
         if result['success']:
-            # Log the download
+            # Log the download without waiting for the fsync
             append_log('download', current_user.username, exam_id,
-                      f"Scrambled paper {exam_id} downloaded by exam center")
+                      f"Scrambled paper {exam_id} downloaded by exam center", wait=False)
             
             return jsonify(result)
         else:
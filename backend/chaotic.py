@@ -4,9 +4,70 @@ import json
 import os
 import secrets
 from Crypto.PublicKey import RSA
-from Crypto.Cipher import PKCS1_OAEP
+from Crypto.Cipher import AES, PKCS1_OAEP
+from Crypto.Util.Padding import unpad
 from Crypto.Random import get_random_bytes
 import base64
+import struct
+import threading
+import time
+from hashing import compute_pixel_digest
+from fileutil import write_new_file, replace_file
+
+# Admin RSA key pair protecting chaos keys
+RSA_KEYS_DIR = '../config'
+RSA_PRIVATE_KEY_FILE_NAME = 'admin_private_key.pem'
+RSA_PUBLIC_KEY_FILE_NAME = 'admin_public_key.pem'
+
+# Master key-encryption key (KEK): a random AES-256 key stored wrapped under
+# the admin RSA public key. It is unwrapped once per process and protects
+# each exam's chaos key with AES-GCM, so bulk releases cost one RSA
+# private-key operation instead of one per exam.
+MASTER_KEK_FILE_NAME = 'master_kek.json'
+
+# The RSA key pair and master KEK form a key set. Key rotation writes each
+# new set to its own directory under KEY_SETS_DIR and switches to it by
+# replacing CURRENT_KEY_SET_FILE (holding the directory name) in a single
+# rename. Until the first rotation the key set is the files in RSA_KEYS_DIR.
+# Earlier sets stay on disk so chaos keys sealed under them remain readable.
+KEY_SETS_DIR = os.path.join(RSA_KEYS_DIR, 'keys')
+CURRENT_KEY_SET_FILE = os.path.join(KEY_SETS_DIR, 'current')
+
+# Chaos key file formats. Legacy files are JSON with the AES key wrapped
+# under RSA (no version field). Version 3 is a binary AEAD envelope sealing
+# the chaos key directly under the master KEK:
+#   magic | version | kek id | nonce | AES-GCM ciphertext | tag
+# with the header (magic, version, kek id) authenticated as associated data.
+CHAOS_KEY_VERSION_ENVELOPE = 3
+CHAOS_KEY_MAGIC = b'ESCK'
+CHAOS_KEY_HEADER = struct.Struct('>4sB8s')
+ENVELOPE_NONCE_SIZE = 12
+ENVELOPE_TAG_SIZE = 16
+
+PAPERS_DIR = '../papers'
+CHAOS_KEY_FILE_NAME = 'chaos_key.enc'
+
+# Per-process cache of the current key set directory: (pointer file stat, directory)
+_key_set_dir_cache = None
+
+# Per-process cache of the parsed key pair: (directory, file signature, private, public)
+_rsa_keys_cache = None
+_rsa_keys_lock = threading.Lock()
+
+# Per-process cache of the unwrapped master KEK: (KEK file, file stat, kek id, kek)
+_master_kek_cache = None
+_master_kek_lock = threading.Lock()
+
+# KEKs of earlier key sets, unwrapped on first use: {kek id: kek}
+_retired_keks = {}
+
+# Released chaos keys, cached so repeated decrypts of an exam skip the file
+# read and key unwrap: {file path: (file stat, expiry time, key JSON)}.
+# Entries are dropped when their exam window ends.
+CHAOS_KEY_CACHE_MAX = 256
+_chaos_key_cache = {}
+_chaos_key_cache_lock = threading.Lock()
+_chaos_key_cache_timer = None
 
 def generate_chaos_key():
     """Generate chaos parameters for pixel scrambling"""
@@ -56,6 +117,11 @@ def inverse_arnold_cat_map(x, y, a, b, N):
 
 def scramble_image(image_path, chaos_key, output_path):
     """Scramble image using chaotic pixel permutation"""
+    success, message, _ = scramble_image_with_digest(image_path, chaos_key, output_path)
+    return success, message
+
+def scramble_image_with_digest(image_path, chaos_key, output_path, digest_algorithm=None):
+    """Scramble image and compute the canonical pixel digest before encoding"""
     try:
         # Load image
         img = Image.open(image_path)
@@ -104,17 +170,28 @@ def scramble_image(image_path, chaos_key, output_path):
                     new_img[new_i, new_j] = scrambled_img[i, j]
             scrambled_img = new_img
         
+        scrambled_img = scrambled_img.astype('uint8', copy=False)
+        
+        # Digest the raw scrambled pixels so integrity survives re-encoding
+        pixel_digest = None
+        if digest_algorithm:
+            pixel_digest = compute_pixel_digest(scrambled_img, 'RGB', digest_algorithm)
+        
         # Save scrambled image
-        scrambled_pil = Image.fromarray(scrambled_img.astype('uint8'))
+        scrambled_pil = Image.fromarray(scrambled_img)
         scrambled_pil.save(output_path)
         
-        return True, "Image scrambled successfully"
-        
+        return True, "Image scrambled successfully", pixel_digest
+    
     except Exception as e:
-        return False, f"Error scrambling image: {e}"
+        return False, f"Error scrambling image: {e}", None
 
 def unscramble_image(scrambled_path, chaos_key, output_path):
-    """Unscramble image using inverse chaotic operations"""
+    """Unscramble image using inverse chaotic operations
+    
+    scrambled_path may also be a file-like object (e.g. an in-memory buffer
+    that has already been integrity-checked).
+    """
     try:
         # Load scrambled image
         img = Image.open(scrambled_path)
@@ -173,109 +250,302 @@ def unscramble_image(scrambled_path, chaos_key, output_path):
     except Exception as e:
         return False, f"Error unscrambling image: {e}"
 
-def get_or_create_rsa_keys():
-    """Get or create RSA key pair for admin"""
-    keys_dir = '../config'
-    private_key_path = os.path.join(keys_dir, 'admin_private_key.pem')
-    public_key_path = os.path.join(keys_dir, 'admin_public_key.pem')
-    
-    os.makedirs(keys_dir, exist_ok=True)
-    
-    if os.path.exists(private_key_path) and os.path.exists(public_key_path):
-        # Load existing keys
-        with open(private_key_path, 'rb') as f:
-            private_key = RSA.import_key(f.read())
-        with open(public_key_path, 'rb') as f:
+def key_set_dir(name):
+    """Directory of a rotated key set"""
+    return os.path.join(KEY_SETS_DIR, name)
+
+def current_key_set_dir():
+    """Directory holding the current RSA key pair and master KEK"""
+    global _key_set_dir_cache
+    
+    try:
+        st = os.stat(CURRENT_KEY_SET_FILE)
+    except FileNotFoundError:
+        return RSA_KEYS_DIR
+    
+    signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+    cache = _key_set_dir_cache
+    if cache and cache[0] == signature:
+        return cache[1]
+    
+    with open(CURRENT_KEY_SET_FILE, 'r') as f:
+        directory = key_set_dir(f.read().strip())
+    _key_set_dir_cache = (signature, directory)
+    return directory
+
+def rsa_key_files_signature(key_dir):
+    """(inode, mtime, size) of a key set's RSA key files, or None if the private key is missing"""
+    signature = []
+    for name in (RSA_PRIVATE_KEY_FILE_NAME, RSA_PUBLIC_KEY_FILE_NAME):
+        try:
+            st = os.stat(os.path.join(key_dir, name))
+            signature.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            if name == RSA_PRIVATE_KEY_FILE_NAME:
+                return None
+            signature.append(None)
+    return tuple(signature)
+
+def create_rsa_keys(key_dir):
+    """Generate the admin key pair unless another caller already has"""
+    private_key = RSA.generate(2048)
+    write_new_file(os.path.join(key_dir, RSA_PRIVATE_KEY_FILE_NAME), private_key.export_key())
+
+def load_rsa_keys(key_dir):
+    """Load a key set's admin key pair, (re)writing the public key file if missing"""
+    with open(os.path.join(key_dir, RSA_PRIVATE_KEY_FILE_NAME), 'rb') as f:
+        private_key = RSA.import_key(f.read())
+    
+    public_key_file = os.path.join(key_dir, RSA_PUBLIC_KEY_FILE_NAME)
+    if os.path.exists(public_key_file):
+        with open(public_key_file, 'rb') as f:
             public_key = RSA.import_key(f.read())
     else:
-        # Generate new RSA key pair
-        private_key = RSA.generate(2048)
+        # Derived from the private key, so every writer produces the same file
         public_key = private_key.publickey()
-        
-        # Save keys
-        with open(private_key_path, 'wb') as f:
-            f.write(private_key.export_key())
-        with open(public_key_path, 'wb') as f:
+        temp_path = f"{public_key_file}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
             f.write(public_key.export_key())
+        os.replace(temp_path, public_key_file)
     
     return private_key, public_key
 
-def encrypt_chaos_key(chaos_key):
-    """Encrypt chaos key using RSA for Admin"""
-    try:
-        # Convert chaos key to JSON string
-        key_json = json.dumps(chaos_key)
-        key_bytes = key_json.encode()
-        
-        # Get RSA public key
-        _, public_key = get_or_create_rsa_keys()
-        
-        # Encrypt with RSA
-        cipher_rsa = PKCS1_OAEP.new(public_key)
-        
-        # RSA can only encrypt small amounts of data, so we use hybrid encryption
-        # Generate AES key for actual data encryption
-        aes_key = get_random_bytes(32)
+def get_or_create_rsa_keys():
+    """Get or create RSA key pair for admin
+    
+    The parsed keys are cached per process and reloaded when either key
+    file changes (inode, mtime or size) or a rotation switches key sets.
+    """
+    global _rsa_keys_cache
+    
+    key_dir = current_key_set_dir()
+    signature = rsa_key_files_signature(key_dir)
+    cache = _rsa_keys_cache
+    if cache and signature and cache[:2] == (key_dir, signature):
+        return cache[2], cache[3]
+    
+    with _rsa_keys_lock:
+        signature = rsa_key_files_signature(key_dir)
+        cache = _rsa_keys_cache
+        if cache and signature and cache[:2] == (key_dir, signature):
+            return cache[2], cache[3]
         
-        # Encrypt the chaos key data with AES
-        from Crypto.Cipher import AES
-        from Crypto.Util.Padding import pad
+        if signature is None:
+            os.makedirs(key_dir, exist_ok=True)
+            create_rsa_keys(key_dir)
         
-        cipher_aes = AES.new(aes_key, AES.MODE_CBC)
-        padded_data = pad(key_bytes, AES.block_size)
-        encrypted_data = cipher_aes.encrypt(padded_data)
+        private_key, public_key = load_rsa_keys(key_dir)
+        _rsa_keys_cache = (key_dir, rsa_key_files_signature(key_dir), private_key, public_key)
         
-        # Encrypt the AES key with RSA
-        encrypted_aes_key = cipher_rsa.encrypt(aes_key)
+        return private_key, public_key
+
+def create_master_kek(kek_file, public_key=None):
+    """Generate a master KEK wrapped under an RSA public key (default: the admin key)"""
+    if public_key is None:
+        _, public_key = get_or_create_rsa_keys()
+    kek = get_random_bytes(32)
+    
+    document = {
+        'version': 1,
+        'kek_id': secrets.token_hex(8),
+        'wrapped_kek': base64.b64encode(PKCS1_OAEP.new(public_key).encrypt(kek)).decode()
+    }
+    write_new_file(kek_file, json.dumps(document, indent=2).encode())
+
+def load_master_kek(kek_file, private_key=None):
+    """Unwrap a master KEK with an RSA private key (default: the one in its key set)
+    
+    Returns (kek id, kek).
+    """
+    with open(kek_file, 'r') as f:
+        document = json.load(f)
+    
+    if private_key is None:
+        private_key, _ = load_rsa_keys(os.path.dirname(kek_file))
+    kek = PKCS1_OAEP.new(private_key).decrypt(base64.b64decode(document['wrapped_kek']))
+    return document['kek_id'], kek
+
+def master_kek_signature(kek_file):
+    """(inode, mtime, size) of a master KEK file, or None if missing"""
+    try:
+        st = os.stat(kek_file)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+def get_master_kek():
+    """Get or create the master KEK as (kek id, kek)
+    
+    Unwrapped once per process and cached until the KEK file changes or a
+    rotation switches key sets.
+    """
+    global _master_kek_cache
+    
+    kek_file = os.path.join(current_key_set_dir(), MASTER_KEK_FILE_NAME)
+    signature = master_kek_signature(kek_file)
+    cache = _master_kek_cache
+    if cache and signature and cache[:2] == (kek_file, signature):
+        return cache[2], cache[3]
+    
+    with _master_kek_lock:
+        signature = master_kek_signature(kek_file)
+        cache = _master_kek_cache
+        if cache and signature and cache[:2] == (kek_file, signature):
+            return cache[2], cache[3]
         
-        # Combine everything
-        result = {
-            'encrypted_aes_key': base64.b64encode(encrypted_aes_key).decode(),
-            'encrypted_data': base64.b64encode(encrypted_data).decode(),
-            'iv': base64.b64encode(cipher_aes.iv).decode()
-        }
+        if signature is None:
+            os.makedirs(os.path.dirname(kek_file), exist_ok=True)
+            create_master_kek(kek_file)
         
-        return json.dumps(result).encode()
+        kek_id, kek = load_master_kek(kek_file)
+        _master_kek_cache = (kek_file, master_kek_signature(kek_file), kek_id, kek)
         
+        return kek_id, kek
+
+def get_retired_master_kek(kek_id):
+    """KEK of an earlier key set still on disk; raises ValueError if there is none
+    
+    Chaos keys sealed while a rotation switched key sets stay readable
+    through this until the rotation re-wraps them.
+    """
+    kek = _retired_keks.get(kek_id)
+    if kek:
+        return kek
+    
+    key_dirs = [RSA_KEYS_DIR]
+    if os.path.isdir(KEY_SETS_DIR):
+        key_dirs += [key_set_dir(name) for name in sorted(os.listdir(KEY_SETS_DIR))]
+    
+    for key_dir in key_dirs:
+        kek_file = os.path.join(key_dir, MASTER_KEK_FILE_NAME)
+        try:
+            with open(kek_file, 'r') as f:
+                if json.load(f).get('kek_id') != kek_id:
+                    continue
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        
+        _, kek = load_master_kek(kek_file)
+        _retired_keks[kek_id] = kek
+        return kek
+    
+    raise ValueError(f"Chaos key is wrapped under unknown KEK {kek_id}")
+
+def seal_chaos_key(key_bytes, master_kek=None):
+    """Encrypt serialized chaos key bytes into a binary AEAD envelope
+    
+    The chaos key is itself small key material, so it is sealed directly
+    under the master KEK (one AES-GCM operation, no separate data key).
+    """
+    kek_id, kek = master_kek or get_master_kek()
+    header = CHAOS_KEY_HEADER.pack(CHAOS_KEY_MAGIC, CHAOS_KEY_VERSION_ENVELOPE, bytes.fromhex(kek_id))
+    
+    cipher = AES.new(kek, AES.MODE_GCM, nonce=get_random_bytes(ENVELOPE_NONCE_SIZE))
+    cipher.update(header)
+    ciphertext, tag = cipher.encrypt_and_digest(key_bytes)
+    
+    return header + cipher.nonce + ciphertext + tag
+
+def parse_envelope(encrypted_key_data):
+    """Split an envelope into (kek id, header, nonce, ciphertext, tag)"""
+    header_size = CHAOS_KEY_HEADER.size
+    if len(encrypted_key_data) < header_size + ENVELOPE_NONCE_SIZE + ENVELOPE_TAG_SIZE:
+        raise ValueError("Chaos key envelope is truncated")
+    
+    magic, version, kek_id = CHAOS_KEY_HEADER.unpack_from(encrypted_key_data)
+    if magic != CHAOS_KEY_MAGIC or version != CHAOS_KEY_VERSION_ENVELOPE:
+        raise ValueError(f"Unsupported chaos key envelope version {version}")
+    
+    nonce_end = header_size + ENVELOPE_NONCE_SIZE
+    return (kek_id.hex(),
+            encrypted_key_data[:header_size],
+            encrypted_key_data[header_size:nonce_end],
+            encrypted_key_data[nonce_end:-ENVELOPE_TAG_SIZE],
+            encrypted_key_data[-ENVELOPE_TAG_SIZE:])
+
+def is_envelope(encrypted_key_data):
+    """True if chaos key data is a binary envelope rather than JSON"""
+    return encrypted_key_data[:len(CHAOS_KEY_MAGIC)] == CHAOS_KEY_MAGIC
+
+def open_chaos_key(encrypted_key_data, private_key=None, master_kek=None):
+    """Decrypt chaos key data in any format to its serialized bytes
+    
+    Envelopes are authenticated before anything is parsed and need the
+    master KEK (default: the current one; envelopes sealed under an earlier
+    key set use its KEK). Legacy files need the RSA private key (default:
+    the admin key).
+    """
+    if is_envelope(encrypted_key_data):
+        kek_id, header, nonce, ciphertext, tag = parse_envelope(encrypted_key_data)
+        current_kek_id, kek = master_kek or get_master_kek()
+        if kek_id != current_kek_id:
+            kek = get_retired_master_kek(kek_id)
+        
+        cipher = AES.new(kek, AES.MODE_GCM, nonce=nonce)
+        cipher.update(header)
+        return cipher.decrypt_and_verify(ciphertext, tag)
+    
+    # Legacy JSON: AES-CBC data with the key wrapped under RSA
+    encrypted_data_json = json.loads(encrypted_key_data.decode())
+    if 'version' in encrypted_data_json:
+        raise ValueError(f"Unsupported chaos key version {encrypted_data_json['version']}")
+    
+    encrypted_data = base64.b64decode(encrypted_data_json['encrypted_data'])
+    iv = base64.b64decode(encrypted_data_json['iv'])
+    
+    if private_key is None:
+        private_key, _ = get_or_create_rsa_keys()
+    cipher_rsa = PKCS1_OAEP.new(private_key)
+    aes_key = cipher_rsa.decrypt(base64.b64decode(encrypted_data_json['encrypted_aes_key']))
+    
+    cipher_aes = AES.new(aes_key, AES.MODE_CBC, iv)
+    return unpad(cipher_aes.decrypt(encrypted_data), AES.block_size)
+
+def chaos_key_kek_id(encrypted_key_data):
+    """Id of the master KEK chaos key data is sealed under (None for legacy RSA files)"""
+    if is_envelope(encrypted_key_data):
+        return parse_envelope(encrypted_key_data)[0]
+    return None
+
+def encrypt_chaos_key(chaos_key):
+    """Encrypt chaos key into an AEAD envelope under the master KEK"""
+    try:
+        return seal_chaos_key(json.dumps(chaos_key).encode())
+    
     except Exception as e:
         print(f"Error encrypting chaos key: {e}")
         return None
 
-def decrypt_chaos_key(encrypted_key_data):
-    """Decrypt chaos key using RSA (Admin only)"""
+def decrypt_chaos_key(encrypted_key_data, master_kek=None):
+    """Decrypt chaos key (Admin only)
+    
+    Reads binary envelopes as well as legacy JSON files (AES key wrapped
+    under the admin RSA key). master_kek defaults to the current one.
+    """
     try:
-        # Parse the encrypted data
-        encrypted_data_json = json.loads(encrypted_key_data.decode())
-        
-        encrypted_aes_key = base64.b64decode(encrypted_data_json['encrypted_aes_key'])
-        encrypted_data = base64.b64decode(encrypted_data_json['encrypted_data'])
-        iv = base64.b64decode(encrypted_data_json['iv'])
-        
-        # Get RSA private key
-        private_key, _ = get_or_create_rsa_keys()
-        
-        # Decrypt AES key with RSA
-        cipher_rsa = PKCS1_OAEP.new(private_key)
-        aes_key = cipher_rsa.decrypt(encrypted_aes_key)
-        
-        # Decrypt data with AES
-        from Crypto.Cipher import AES
-        from Crypto.Util.Padding import unpad
-        
-        cipher_aes = AES.new(aes_key, AES.MODE_CBC, iv)
-        decrypted_padded = cipher_aes.decrypt(encrypted_data)
-        decrypted_data = unpad(decrypted_padded, AES.block_size)
-        
-        # Parse back to dictionary
-        key_json = decrypted_data.decode()
-        chaos_key = json.loads(key_json)
-        
-        return chaos_key
-        
+        return json.loads(open_chaos_key(encrypted_key_data, master_kek=master_kek))
+    
     except Exception as e:
         print(f"Error decrypting chaos key: {e}")
         return None
 
+def rewrap_chaos_key(encrypted_key_data, old_private_key, old_master_kek, new_master_kek):
+    """Re-encrypt chaos key data into an envelope under a new master KEK
+    
+    Legacy files are opened with old_private_key, envelopes with
+    old_master_kek (either may be None if not needed). Returns None if the
+    data is already sealed under new_master_kek.
+    """
+    if chaos_key_kek_id(encrypted_key_data) == new_master_kek[0]:
+        return None
+    
+    key_bytes = open_chaos_key(encrypted_key_data, old_private_key, old_master_kek)
+    return seal_chaos_key(key_bytes, new_master_kek)
+
+def is_legacy_chaos_key(encrypted_key_data):
+    """True if chaos key data predates the binary envelope"""
+    return not is_envelope(encrypted_key_data)
+
 def save_encrypted_chaos_key(chaos_key, file_path):
     """Save encrypted chaos key to file"""
     try:
@@ -301,4 +571,116 @@ def load_encrypted_chaos_key(file_path):
         
     except Exception as e:
         print(f"Error loading encrypted chaos key: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def chaos_key_file_signature(file_path):
+    """(inode, mtime, size) of a chaos key file, or None if missing"""
+    try:
+        st = os.stat(file_path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+def schedule_cache_purge():
+    """Arm a timer for the earliest expiry in the cache (lock held)"""
+    global _chaos_key_cache_timer
+    
+    if _chaos_key_cache_timer:
+        _chaos_key_cache_timer.cancel()
+        _chaos_key_cache_timer = None
+    
+    if _chaos_key_cache:
+        delay = min(entry[1] for entry in _chaos_key_cache.values()) - time.time()
+        _chaos_key_cache_timer = threading.Timer(max(delay, 0), purge_chaos_key_cache)
+        _chaos_key_cache_timer.daemon = True
+        _chaos_key_cache_timer.start()
+
+def purge_chaos_key_cache():
+    """Drop cached chaos keys whose exam window has ended"""
+    with _chaos_key_cache_lock:
+        now = time.time()
+        for file_path in [path for path, entry in _chaos_key_cache.items() if entry[1] <= now]:
+            del _chaos_key_cache[file_path]
+        schedule_cache_purge()
+
+def load_released_chaos_key(file_path, expires_at):
+    """Load a released chaos key, caching it until expires_at (a Unix time)
+    
+    Only call this once the exam's release time has passed. The key is kept
+    serialized and the dict returned is rebuilt per call, so callers cannot
+    change the cached key. A changed key file (re-upload, rotation) is re-read.
+    """
+    signature = chaos_key_file_signature(file_path)
+    
+    with _chaos_key_cache_lock:
+        entry = _chaos_key_cache.get(file_path)
+        if entry and entry[0] == signature and entry[1] > time.time():
+            return json.loads(entry[2])
+    
+    chaos_key = load_encrypted_chaos_key(file_path)
+    if chaos_key is None or expires_at <= time.time():
+        return chaos_key
+    
+    with _chaos_key_cache_lock:
+        _chaos_key_cache.pop(file_path, None)
+        
+        # Full: drop the key whose window ends first
+        if len(_chaos_key_cache) >= CHAOS_KEY_CACHE_MAX:
+            soonest = min(_chaos_key_cache, key=lambda path: _chaos_key_cache[path][1])
+            del _chaos_key_cache[soonest]
+        
+        _chaos_key_cache[file_path] = (signature, expires_at, json.dumps(chaos_key))
+        schedule_cache_purge()
+    
+    return chaos_key
+
+def migrate_chaos_key_file(file_path):
+    """Convert one legacy chaos key file to an envelope under the master KEK
+    
+    Returns True if the file was migrated, False if it already is an envelope.
+    """
+    with open(file_path, 'rb') as f:
+        encrypted_key = f.read()
+    
+    if not is_legacy_chaos_key(encrypted_key):
+        return False
+    
+    chaos_key = decrypt_chaos_key(encrypted_key)
+    if chaos_key is None:
+        raise ValueError(f"Cannot decrypt {file_path}")
+    
+    encrypted_key = encrypt_chaos_key(chaos_key)
+    if encrypted_key is None:
+        raise ValueError(f"Cannot re-encrypt {file_path}")
+    
+    replace_file(file_path, encrypted_key)
+    return True
+
+def migrate_chaos_keys(papers_dir=PAPERS_DIR):
+    """Convert every exam's legacy chaos key to an envelope under the master KEK"""
+    try:
+        migrated = 0
+        failed = []
+        
+        for exam_id in sorted(os.listdir(papers_dir)) if os.path.exists(papers_dir) else []:
+            file_path = os.path.join(papers_dir, exam_id, CHAOS_KEY_FILE_NAME)
+            if not os.path.exists(file_path):
+                continue
+            
+            try:
+                if migrate_chaos_key_file(file_path):
+                    migrated += 1
+            except Exception as e:
+                print(f"Error migrating chaos key of exam {exam_id}: {e}")
+                failed.append(exam_id)
+        
+        if failed:
+            return False, f"Migrated {migrated} chaos key(s); failed for: {', '.join(failed)}"
+        return True, f"Migrated {migrated} chaos key(s) to the master KEK"
+    
+    except Exception as e:
+        return False, f"Error migrating chaos keys: {e}"
+
+if __name__ == '__main__':
+    success, message = migrate_chaos_keys()
+    print(message)
@@ -1,8 +1,10 @@
 import os
 import json
 from datetime import datetime
-from chaotic import load_encrypted_chaos_key, unscramble_image
-from timelock import check_release_time
+from chaotic import load_released_chaos_key, unscramble_image
+from timelock import check_release_time, get_exam_end_time
+from hashing import load_integrity_manifest, compute_bytes_digest, compute_image_pixel_digest
+import io
 import zipfile
 import tempfile
 
@@ -101,6 +103,45 @@ def create_scrambled_package(exam_id, upload_folder, output_path=None):
     except Exception as e:
         return {'success': False, 'error': f'Package creation failed: {e}'}
 
+def read_verified_pages(exam_dir, scrambled_files):
+    """Read each scrambled page once and verify it against the integrity manifest
+    
+    Returns (buffers, error) where buffers maps file name to the verified bytes,
+    so the same bytes can be decoded for unscrambling without a second read.
+    """
+    manifest = load_integrity_manifest(exam_dir)
+    if manifest is None:
+        return None, 'Integrity file not found'
+    
+    entries_by_file = {entry['file']: entry for entry in manifest['files'].values()}
+    
+    missing = set(entries_by_file) - set(scrambled_files)
+    if missing:
+        return None, f'Scrambled page missing: {sorted(missing)[0]}'
+    
+    buffers = {}
+    for scrambled_file in scrambled_files:
+        entry = entries_by_file.get(scrambled_file)
+        if not entry:
+            return None, f'No integrity record for {scrambled_file}'
+        
+        with open(os.path.join(exam_dir, scrambled_file), 'rb') as f:
+            data = f.read()
+        
+        algorithm = entry.get('algorithm', 'sha256')
+        valid = compute_bytes_digest(data, algorithm) == entry['digest']
+        
+        # Re-encoded pages are accepted if their decoded pixels still match
+        if not valid and entry.get('pixel_digest'):
+            valid = compute_image_pixel_digest(io.BytesIO(data), algorithm) == entry['pixel_digest']
+        
+        if not valid:
+            return None, f'Integrity check failed for {scrambled_file}'
+        
+        buffers[scrambled_file] = data
+    
+    return buffers, None
+
 def decrypt_paper(exam_id, upload_folder):
     """Decrypt scrambled paper when chaos key is released"""
     try:
@@ -130,8 +171,9 @@ def decrypt_paper(exam_id, upload_folder):
         if not os.path.exists(chaos_key_path):
             return {'success': False, 'error': 'Chaos key not found'}
         
-        # Load chaos key
-        chaos_key = load_encrypted_chaos_key(chaos_key_path)
+        # Load chaos key (cached until the exam window closes)
+        expires_at = get_exam_end_time(scheduled_time).timestamp()
+        chaos_key = load_released_chaos_key(chaos_key_path, expires_at)
         if not chaos_key:
             return {'success': False, 'error': 'Failed to load chaos key'}
         
@@ -150,16 +192,21 @@ def decrypt_paper(exam_id, upload_folder):
         # Sort by page number
         scrambled_images.sort(key=lambda x: int(x.split('_page_')[1].split('.')[0]))
         
+        # Read and verify every page before any unscrambling, so a tampered
+        # exam fails fast and intact pages are only read from disk once
+        page_buffers, error = read_verified_pages(exam_dir, scrambled_images)
+        if error:
+            return {'success': False, 'error': error}
+        
         for scrambled_file in scrambled_images:
-            scrambled_path = os.path.join(exam_dir, scrambled_file)
-            
             # Create decrypted filename
             page_num = scrambled_file.split('_page_')[1].split('.')[0]
             decrypted_file = f'page_{page_num}.png'
             decrypted_path = os.path.join(decrypted_dir, decrypted_file)
             
-            # Unscramble image
-            success, message = unscramble_image(scrambled_path, chaos_key, decrypted_path)
+            # Unscramble image from the verified buffer
+            scrambled_buffer = io.BytesIO(page_buffers.pop(scrambled_file))
+            success, message = unscramble_image(scrambled_buffer, chaos_key, decrypted_path)
             
             if success:
                 decrypted_images.append(decrypted_path)
@@ -180,6 +227,7 @@ def decrypt_paper(exam_id, upload_folder):
             'decrypted_images': decrypted_images,
             'total_pages': len(decrypted_images),
             'decrypted_dir': decrypted_dir,
+            'integrity_verified': True,
             'message': 'Paper decrypted successfully'
         }
         
@@ -0,0 +1,36 @@
+import os
+import secrets
+
+# Whole-file writes for keys and other small state files. Both write to a
+# temp file next to the target first, so readers never see a partial file.
+
+def write_new_file(path, data):
+    """Write a file unless it already exists (0600, visible only once complete)
+    
+    The data goes to a temp file that is hard-linked into place, which fails
+    if the path already exists, so concurrent creators (in any process) all
+    end up using the first file written. Returns True if this call wrote it.
+    """
+    temp_path = f"{path}.{os.getpid()}.{secrets.token_hex(4)}.tmp"
+    
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.link(temp_path, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(temp_path)
+
+def replace_file(path, data):
+    """Atomically replace a file's contents"""
+    temp_path = f"{path}.{os.getpid()}.{secrets.token_hex(4)}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
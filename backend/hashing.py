@@ -1,21 +1,111 @@
 import hashlib
+import multiprocessing
 import os
 import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-def compute_sha256(file_path):
-    """Compute SHA-256 hash of a file"""
+# Digest algorithms available for page integrity. BLAKE2b is the default for
+# new uploads (faster than SHA-256 on 64-bit CPUs); SHA-256 is kept so exams
+# uploaded before versioned manifests still verify.
+DIGEST_ALGORITHMS = {
+    'sha256': hashlib.sha256,
+    'blake2b': hashlib.blake2b
+}
+DEFAULT_DIGEST_ALGORITHM = 'blake2b'
+
+# Versioned integrity manifest (integrity.json). Legacy exams only have the
+# plain-text integrity.sha256 file with "page_N: <sha256>" lines.
+# Version 2 adds an optional canonical pixel digest per page.
+INTEGRITY_MANIFEST = 'integrity.json'
+LEGACY_INTEGRITY_FILE = 'integrity.sha256'
+MANIFEST_VERSION = 2
+
+# Read size used when hashing files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Parallel chain verification: entries per worker task, and the chain length
+# below which process start-up costs more than it saves
+CHAIN_VERIFY_CHUNK_SIZE = 50000
+PARALLEL_VERIFY_MIN_ENTRIES = 20000
+
+def compute_file_digest(file_path, algorithm=DEFAULT_DIGEST_ALGORITHM, throttle=None):
+    """Compute the hex digest of a file with the given algorithm
+    
+    If given, throttle is called with the size of each chunk read so that
+    background callers can enforce an I/O budget.
+    """
     try:
-        sha256_hash = hashlib.sha256()
+        if algorithm not in DIGEST_ALGORITHMS:
+            raise ValueError(f"Unsupported digest algorithm: {algorithm}")
+        
+        file_hash = DIGEST_ALGORITHMS[algorithm]()
         
         with open(file_path, 'rb') as f:
             # Read file in chunks to handle large files
-            for chunk in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(chunk)
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                file_hash.update(chunk)
+                if throttle:
+                    throttle(len(chunk))
         
-        return sha256_hash.hexdigest()
+        return file_hash.hexdigest()
         
     except Exception as e:
-        print(f"Error computing SHA-256: {e}")
+        print(f"Error computing {algorithm} digest: {e}")
+        return None
+
+def compute_bytes_digest(data, algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """Compute the hex digest of an in-memory buffer"""
+    try:
+        if algorithm not in DIGEST_ALGORITHMS:
+            raise ValueError(f"Unsupported digest algorithm: {algorithm}")
+        
+        return DIGEST_ALGORITHMS[algorithm](data).hexdigest()
+        
+    except Exception as e:
+        print(f"Error computing {algorithm} digest: {e}")
+        return None
+
+def compute_sha256(file_path):
+    """Compute SHA-256 hash of a file"""
+    return compute_file_digest(file_path, 'sha256')
+
+def compute_pixel_digest(pixels, mode, algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """Compute a canonical digest over a raw pixel buffer.
+    
+    The digest covers a header (mode, shape, dtype) followed by the row-major
+    pixel bytes, so it does not depend on how the image is encoded on disk.
+    """
+    try:
+        if algorithm not in DIGEST_ALGORITHMS:
+            raise ValueError(f"Unsupported digest algorithm: {algorithm}")
+        
+        header = f"pixels-v1;{mode};{'x'.join(str(d) for d in pixels.shape)};{pixels.dtype.str}\n"
+        
+        pixel_hash = DIGEST_ALGORITHMS[algorithm]()
+        pixel_hash.update(header.encode())
+        pixel_hash.update(pixels.data if pixels.flags['C_CONTIGUOUS'] else pixels.tobytes())
+        
+        return pixel_hash.hexdigest()
+        
+    except Exception as e:
+        print(f"Error computing pixel digest: {e}")
+        return None
+
+def compute_image_pixel_digest(file_path, algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """Decode an image file and compute the canonical digest of its pixels"""
+    try:
+        import numpy as np
+        from PIL import Image
+        
+        with Image.open(file_path) as img:
+            mode = img.mode
+            pixels = np.asarray(img)
+        
+        return compute_pixel_digest(pixels, mode, algorithm)
+        
+    except Exception as e:
+        print(f"Error computing image pixel digest: {e}")
         return None
 
 def compute_string_hash(text):
@@ -26,45 +116,117 @@ def compute_string_hash(text):
         print(f"Error computing string hash: {e}")
         return None
 
-def verify_integrity(exam_id, upload_folder):
+def write_integrity_manifest(exam_dir, page_hashes, algorithm=DEFAULT_DIGEST_ALGORITHM, pixel_digests=None):
+    """Write the versioned integrity manifest for an exam's scrambled pages"""
+    try:
+        files = {}
+        for page, hash_val in page_hashes.items():
+            page_num = page.split('_')[1]
+            files[page] = {
+                'file': f'scrambled_page_{page_num}.png',
+                'algorithm': algorithm,
+                'digest': hash_val
+            }
+            
+            if pixel_digests and pixel_digests.get(page):
+                files[page]['pixel_digest'] = pixel_digests[page]
+        
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'default_algorithm': algorithm,
+            'files': files
+        }
+        
+        manifest_path = os.path.join(exam_dir, INTEGRITY_MANIFEST)
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        
+        return True
+        
+    except Exception as e:
+        print(f"Error writing integrity manifest: {e}")
+        return False
+
+def load_integrity_manifest(exam_dir):
+    """Load the integrity manifest, upgrading legacy integrity.sha256 in memory"""
+    manifest_path = os.path.join(exam_dir, INTEGRITY_MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        
+        if manifest.get('version', 0) > MANIFEST_VERSION:
+            raise ValueError(f"Unsupported integrity manifest version: {manifest.get('version')}")
+        
+        return manifest
+    
+    legacy_path = os.path.join(exam_dir, LEGACY_INTEGRITY_FILE)
+    if not os.path.exists(legacy_path):
+        return None
+    
+    # Legacy exams: one "page_N: <sha256>" line per scrambled page
+    files = {}
+    with open(legacy_path, 'r') as f:
+        for line in f:
+            if ':' in line:
+                page, hash_val = line.strip().split(': ', 1)
+                page_num = page.split('_')[1]
+                files[page] = {
+                    'file': f'scrambled_page_{page_num}.png',
+                    'algorithm': 'sha256',
+                    'digest': hash_val
+                }
+    
+    return {
+        'version': 0,
+        'default_algorithm': 'sha256',
+        'files': files
+    }
+
+def verify_integrity(exam_id, upload_folder, throttle=None):
     """Verify integrity of scrambled exam papers"""
     try:
         exam_dir = os.path.join(upload_folder, exam_id)
-        integrity_path = os.path.join(exam_dir, 'integrity.sha256')
+        manifest = load_integrity_manifest(exam_dir)
         
-        if not os.path.exists(integrity_path):
+        if manifest is None:
             return {'valid': False, 'error': 'Integrity file not found'}
         
-        # Read stored hashes
-        stored_hashes = {}
-        with open(integrity_path, 'r') as f:
-            for line in f:
-                if ':' in line:
-                    page, hash_val = line.strip().split(': ', 1)
-                    stored_hashes[page] = hash_val
+        stored_files = manifest['files']
         
-        # Verify each scrambled image
+        # Verify each scrambled image with the algorithm recorded for it
         verification_results = {}
         all_valid = True
         
-        for page, stored_hash in stored_hashes.items():
-            page_num = page.split('_')[1]
-            scrambled_file = os.path.join(exam_dir, f'scrambled_page_{page_num}.png')
+        for page, entry in stored_files.items():
+            stored_hash = entry['digest']
+            algorithm = entry.get('algorithm', 'sha256')
+            scrambled_file = os.path.join(exam_dir, entry['file'])
             
             if os.path.exists(scrambled_file):
-                current_hash = compute_sha256(scrambled_file)
+                current_hash = compute_file_digest(scrambled_file, algorithm, throttle)
                 is_valid = current_hash == stored_hash
                 
                 verification_results[page] = {
+                    'algorithm': algorithm,
                     'stored_hash': stored_hash,
                     'current_hash': current_hash,
                     'valid': is_valid
                 }
                 
+                # A re-encoded page no longer matches its file digest, but its
+                # decoded pixels must still match the canonical pixel digest
+                if not is_valid and entry.get('pixel_digest'):
+                    current_pixel_digest = compute_image_pixel_digest(scrambled_file, algorithm)
+                    is_valid = current_pixel_digest == entry['pixel_digest']
+                    
+                    verification_results[page]['pixel_digest_valid'] = is_valid
+                    verification_results[page]['valid'] = is_valid
+                
                 if not is_valid:
                     all_valid = False
             else:
                 verification_results[page] = {
+                    'algorithm': algorithm,
                     'stored_hash': stored_hash,
                     'current_hash': None,
                     'valid': False,
@@ -75,8 +237,9 @@ def verify_integrity(exam_id, upload_folder):
         return {
             'valid': all_valid,
             'exam_id': exam_id,
+            'manifest_version': manifest['version'],
             'verification_results': verification_results,
-            'total_pages': len(stored_hashes)
+            'total_pages': len(stored_files)
         }
         
     except Exception as e:
@@ -93,14 +256,30 @@ def create_hash_chain_entry(prev_hash, data):
         print(f"Error creating hash chain entry: {e}")
         return None
 
-def verify_hash_chain(log_entries):
-    """Verify the integrity of a hash chain"""
+def log_entry_hash_data(entry):
+    """Build the fields of a log entry that are covered by its chain hash"""
+    return {
+        'id': entry['id'],
+        'event': entry['event'],
+        'user': entry['user'],
+        'exam_id': entry.get('exam_id'),
+        'timestamp': entry['timestamp'],
+        'details': entry.get('details', '')
+    }
+
+def verify_hash_chain(log_entries, anchor_hash="0000"):
+    """Verify the integrity of a hash chain
+    
+    anchor_hash is the hash the first entry must link to: "0000" for a chain
+    starting at system init, or the hash of the last already-verified entry
+    when only a suffix of the chain is being checked.
+    """
     try:
         if not log_entries:
             return True
         
-        # First entry should have prev_hash of "0000" or similar
-        if log_entries[0].get('prev_hash') != "0000":
+        # First entry should link to the anchor ("0000" for a full chain)
+        if log_entries[0].get('prev_hash') != anchor_hash:
             return False
         
         # Verify each subsequent entry
@@ -108,14 +287,7 @@ def verify_hash_chain(log_entries):
             entry = log_entries[i]
             
             # Create data without the hash field for verification
-            data_for_hash = {
-                'id': entry['id'],
-                'event': entry['event'],
-                'user': entry['user'],
-                'exam_id': entry.get('exam_id'),
-                'timestamp': entry['timestamp'],
-                'details': entry.get('details', '')
-            }
+            data_for_hash = log_entry_hash_data(entry)
             
             prev_hash = entry['prev_hash']
             expected_hash = create_hash_chain_entry(prev_hash, data_for_hash)
@@ -133,6 +305,139 @@ def verify_hash_chain(log_entries):
         print(f"Error verifying hash chain: {e}")
         return False
 
+def find_first_bad_hash(log_entries):
+    """Return the index of the first entry whose stored hash is wrong, or None
+    
+    Each entry's expected hash depends only on its own stored prev_hash and
+    fields, so chunks of a chain can be checked independently.
+    """
+    for index, entry in enumerate(log_entries):
+        try:
+            expected_hash = create_hash_chain_entry(entry['prev_hash'], log_entry_hash_data(entry))
+            if expected_hash != entry['hash']:
+                return index
+        except (KeyError, TypeError):
+            return index
+    
+    return None
+
+class ChainHashChecker:
+    """Rehash a stream of chain entries in bounded batches on one worker pool
+    
+    Entries are added in chain order and sent to the pool in batches of
+    chunk_size; at most two batches per worker are held in memory at a
+    time. first_bad is the chain index of the first entry found with a
+    wrong stored hash (and first_bad_id its id), or None so far.
+    """
+    
+    def __init__(self, workers=None, chunk_size=CHAIN_VERIFY_CHUNK_SIZE):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.executor = None
+        self.pending = deque()
+        self.batch = []
+        self.batch_start = 0
+        self.first_bad = None
+        self.first_bad_id = None
+    
+    def add(self, entry):
+        self.batch.append(entry)
+        if len(self.batch) >= self.chunk_size:
+            self.submit_batch()
+    
+    def submit_batch(self, final=False):
+        batch, start = self.batch, self.batch_start
+        self.batch = []
+        self.batch_start += len(batch)
+        if not batch or self.first_bad is not None:
+            return
+        
+        # A single worker, or a chain shorter than one batch, is checked in-process
+        if self.workers == 1 or (final and self.executor is None):
+            self.record(start, batch, find_first_bad_hash(batch))
+            return
+        
+        if self.executor is None:
+            # Spawned, not forked: the caller is a threaded web worker, and a
+            # forked child could inherit a lock held by one of its threads
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        self.pending.append((start, batch, self.executor.submit(find_first_bad_hash, batch)))
+        
+        while len(self.pending) > 2 * self.workers:
+            self.collect_oldest()
+    
+    def collect_oldest(self):
+        start, batch, future = self.pending.popleft()
+        self.record(start, batch, future.result())
+    
+    def record(self, start, batch, bad_offset):
+        if bad_offset is not None and self.first_bad is None:
+            self.first_bad = start + bad_offset
+            self.first_bad_id = batch[bad_offset].get('id')
+    
+    def finish(self):
+        """Check the remaining entries; returns the index of the first bad hash, or None"""
+        try:
+            self.submit_batch(final=True)
+            while self.pending:
+                self.collect_oldest()
+            return self.first_bad
+        finally:
+            self.close()
+    
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+def find_first_broken_entry(log_entries, anchor_hash="0000", workers=None,
+                            chunk_size=CHAIN_VERIFY_CHUNK_SIZE):
+    """Return the index of the first entry that breaks a hash chain, or None
+    
+    Entry hashes are recomputed in chunks across worker processes, then the
+    prev_hash links are checked in a single cheap linear pass.
+    """
+    if not log_entries:
+        return None
+    
+    if len(log_entries) < PARALLEL_VERIFY_MIN_ENTRIES:
+        workers = 1
+    
+    # Find the first entry whose own hash does not match its contents
+    checker = ChainHashChecker(workers, chunk_size)
+    for entry in log_entries:
+        checker.add(entry)
+    first_bad = checker.finish()
+    
+    # Linear link check, stopping at the first bad hash if there is one
+    end = first_bad if first_bad is not None else len(log_entries)
+    expected_prev = anchor_hash
+    for index in range(end):
+        entry = log_entries[index]
+        if entry.get('prev_hash') != expected_prev:
+            return index
+        expected_prev = entry['hash']
+    
+    return first_bad
+
+def verify_hash_chain_parallel(log_entries, anchor_hash="0000", workers=None,
+                               chunk_size=CHAIN_VERIFY_CHUNK_SIZE):
+    """Verify a hash chain using multiple processes
+    
+    Returns (valid, first_broken_id); first_broken_id is None when valid.
+    """
+    try:
+        broken = find_first_broken_entry(log_entries, anchor_hash, workers, chunk_size)
+        if broken is not None:
+            return False, log_entries[broken].get('id')
+        
+        return True, None
+        
+    except Exception as e:
+        print(f"Error verifying hash chain in parallel: {e}")
+        return False, None
+
 def compute_metadata_hash(metadata):
     """Compute hash of metadata for integrity verification"""
     try:
@@ -144,14 +449,14 @@ def compute_metadata_hash(metadata):
         print(f"Error computing metadata hash: {e}")
         return None
 
-def verify_file_integrity_batch(file_paths):
+def verify_file_integrity_batch(file_paths, algorithm='sha256'):
     """Verify integrity of multiple files at once"""
     try:
         results = {}
         
         for file_path in file_paths:
             if os.path.exists(file_path):
-                file_hash = compute_sha256(file_path)
+                file_hash = compute_file_digest(file_path, algorithm)
                 results[file_path] = {
                     'exists': True,
                     'hash': file_hash,
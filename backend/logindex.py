@@ -0,0 +1,351 @@
+import json
+import os
+import shutil
+import logstore
+
+# Secondary indexes over each log chain. For every indexed field value a
+# posting file lists the (segment, offset) position of each matching entry,
+# so filtered and time-range queries only read the entries they return.
+# Indexes live in <chain dir>/index/<field>/<quoted value>.jsonl and are
+# appended to under the chain's lock right after each group commit. The
+# state file records the log position they cover together with running
+# statistics (counts per event, user and exam, first/last timestamps).
+INDEX_DIR_NAME = 'index'
+INDEX_STATE_FILE = 'state.json'
+
+# Timestamps are indexed by hour bucket ('2024-01-31T14')
+INDEX_FIELDS = ('exam_id', 'user', 'event', 'hour')
+
+# Statistics counter kept for each filterable field
+STATS_COUNTERS = {'event': 'events', 'user': 'users', 'exam_id': 'exams'}
+
+# Postings buffered in memory before flushing during a rebuild
+REBUILD_FLUSH_POSTINGS = 100000
+
+def index_dir(chain=logstore.SYSTEM_CHAIN):
+    """Directory holding a chain's indexes"""
+    return os.path.join(logstore.chain_dir(chain), INDEX_DIR_NAME)
+
+def posting_path(chain, field, key):
+    """Path of the posting file for one field value"""
+    return os.path.join(index_dir(chain), field, logstore.quote_name(str(key)) + '.jsonl')
+
+def index_keys(entry):
+    """Yield the (field, key) pairs an entry is indexed under"""
+    for field in ('exam_id', 'user', 'event'):
+        if entry.get(field):
+            yield field, entry[field]
+    yield 'hour', entry['timestamp'][:13]
+
+def new_stats():
+    """Empty running statistics"""
+    return {
+        'total_entries': 0,
+        'events': {},
+        'users': {},
+        'exams': {},
+        'first_entry': None,
+        'last_entry': None
+    }
+
+def stats_may_match(stats, filters):
+    """Whether a chain with these statistics can hold entries matching filters"""
+    for field, key in filters.items():
+        counts = stats.get(STATS_COUNTERS.get(field))
+        if counts is not None and not counts.get(key):
+            return False
+    return True
+
+def add_to_stats(stats, entry):
+    """Count one entry into running statistics"""
+    stats['total_entries'] += 1
+    stats['events'][entry['event']] = stats['events'].get(entry['event'], 0) + 1
+    stats['users'][entry['user']] = stats['users'].get(entry['user'], 0) + 1
+    if entry.get('exam_id'):
+        stats['exams'][entry['exam_id']] = stats['exams'].get(entry['exam_id'], 0) + 1
+    
+    timestamp = entry['timestamp']
+    if stats['first_entry'] is None or timestamp < stats['first_entry']:
+        stats['first_entry'] = timestamp
+    if stats['last_entry'] is None or timestamp > stats['last_entry']:
+        stats['last_entry'] = timestamp
+
+def load_index_state(chain=logstore.SYSTEM_CHAIN):
+    """Get the index state (covered log position and statistics), or None"""
+    try:
+        with open(os.path.join(index_dir(chain), INDEX_STATE_FILE), 'r') as f:
+            state = json.load(f)
+        
+        if 'stats' not in state:
+            return None
+        return state
+    
+    except (OSError, ValueError):
+        return None
+
+def open_creating_dirs(path, mode):
+    """Open a file for writing, creating its directory only when it is missing
+    
+    Saves a makedirs call per file on every commit once the index exists.
+    """
+    try:
+        return open(path, mode)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return open(path, mode)
+
+def state_position(state):
+    """The (segment, offset) log position an index state covers, or None"""
+    return (state['segment'], state['offset']) if state else None
+
+def save_index_state(chain, position, stats):
+    """Record the log position the index covers and the statistics up to it"""
+    path = os.path.join(index_dir(chain), INDEX_STATE_FILE)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    data = json.dumps({'segment': position[0], 'offset': position[1], 'stats': stats})
+    with open_creating_dirs(temp_path, 'w') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def write_postings(chain, postings):
+    """Append buffered postings ({(field, key): [lines]}) to their files"""
+    for (field, key), lines in postings.items():
+        with open_creating_dirs(posting_path(chain, field, key), 'ab') as f:
+            f.write(b''.join(lines))
+
+def add_postings(postings, segment, offset, entry):
+    """Buffer the postings of one entry"""
+    line = json.dumps([segment, offset]).encode() + b'\n'
+    for field, key in index_keys(entry):
+        postings.setdefault((field, key), []).append(line)
+
+def index_range_locked(chain, state):
+    """Index every entry after an index state to the end of the chain
+    
+    With no state the chain's index is rebuilt from scratch. Must be
+    called with logstore.store_lock(chain) held. Returns the position
+    indexed up to.
+    """
+    if state is None:
+        shutil.rmtree(index_dir(chain), ignore_errors=True)
+        stats = new_stats()
+    else:
+        stats = state['stats']
+    
+    start = state_position(state)
+    postings = {}
+    position = start or (None, 0)
+    count = 0
+    
+    for segment, offset, end_offset, record in logstore.iter_records(start, chain):
+        if not logstore.is_segment_record(record):
+            add_postings(postings, segment, offset, record)
+            add_to_stats(stats, record)
+            count += 1
+            if count % REBUILD_FLUSH_POSTINGS == 0:
+                write_postings(chain, postings)
+                postings = {}
+        position = (segment, end_offset)
+    
+    write_postings(chain, postings)
+    if position[0] is not None:
+        save_index_state(chain, position, stats)
+    
+    return position
+
+def state_on_record_boundary(chain, state):
+    """Check that an index state's position ends a record of its segment
+    
+    An in-place edit of a segment moves the record boundaries, so a
+    catch-up from the old position would start mid-line.
+    """
+    segment, offset = state_position(state)
+    path = logstore.find_segment_file(segment, chain)
+    if path is None:
+        return False
+    if offset == 0:
+        return True
+    
+    try:
+        with logstore.open_segment(path) as f:
+            f.seek(offset - 1)
+            return f.read(1) == b'\n'
+    except (OSError, EOFError):
+        return False
+
+def catch_up_locked(chain, state):
+    """Index the log after an index state, rebuilding when the state no longer fits the log
+    
+    Must be called with logstore.store_lock(chain) held. Returns the
+    position indexed up to. Tampering itself is reported by verification;
+    here the index is just rebuilt from whatever the log now holds.
+    """
+    if state is not None and not state_on_record_boundary(chain, state):
+        print(f"Log index of chain {chain} does not end on a log record; rebuilding")
+        state = None
+    
+    try:
+        return index_range_locked(chain, state)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        if state is None:
+            raise
+        print(f"Log index of chain {chain} does not match the log ({e}); rebuilding")
+        return index_range_locked(chain, None)
+
+def index_batch(chain, start, written, end):
+    """Index a just-committed batch (called by logstore under the chain lock)
+    
+    start and end are the log positions before and after the batch. If the
+    index does not end exactly at start (first use, or a crash between a
+    commit and its indexing) it catches up from the log instead.
+    """
+    state = load_index_state(chain)
+    if state_position(state) != start:
+        catch_up_locked(chain, state)
+        return
+    
+    postings = {}
+    stats = state['stats']
+    for segment, offset, entry in written:
+        add_postings(postings, segment, offset, entry)
+        add_to_stats(stats, entry)
+    
+    write_postings(chain, postings)
+    save_index_state(chain, end, stats)
+
+def update_index(chain=logstore.SYSTEM_CHAIN):
+    """Bring a chain's index up to date with the log; returns its state
+    
+    If the log cannot be indexed (a record that no longer parses) the error
+    is printed and the index left as it is, so reads keep working while
+    verification reports the damage.
+    """
+    with logstore.store_lock(chain):
+        tail = logstore.refresh_tail(chain)
+        if tail is None:
+            return None
+        
+        state = load_index_state(chain)
+        if state_position(state) != (tail['segment'], tail['offset']):
+            try:
+                catch_up_locked(chain, state)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                print(f"Error indexing log chain {chain}: {e}")
+            state = load_index_state(chain)
+        
+        return state
+
+def rebuild_index(chain=None):
+    """Rebuild the indexes of one chain (or all chains) from the raw log"""
+    try:
+        chains = [chain] if chain else logstore.list_chains()
+        
+        for current in chains:
+            with logstore.store_lock(current):
+                index_range_locked(current, None)
+        
+        return True, f"Rebuilt indexes for {len(chains)} chain(s)"
+    
+    except Exception as e:
+        return False, f"Error rebuilding log indexes: {e}"
+
+def get_stats(chain=logstore.SYSTEM_CHAIN):
+    """Maintained statistics of a chain (catching up the index first)"""
+    state = update_index(chain)
+    return state['stats'] if state else new_stats()
+
+def read_postings(chain, field, key):
+    """Read the set of (segment, offset) positions for one field value"""
+    path = posting_path(chain, field, key)
+    if not os.path.exists(path):
+        return set()
+    
+    with open(path, 'rb') as f:
+        return {tuple(json.loads(line)) for line in f if line.endswith(b'\n')}
+
+def hour_keys(chain, since=None, until=None):
+    """List the hour buckets of a chain overlapping [since, until]"""
+    hour_dir = os.path.join(index_dir(chain), 'hour')
+    if not os.path.exists(hour_dir):
+        return []
+    
+    keys = []
+    for file in os.listdir(hour_dir):
+        key = logstore.unquote_name(file[:-len('.jsonl')])
+        if since and key < since[:13]:
+            continue
+        if until and key > until[:13]:
+            continue
+        keys.append(key)
+    
+    return keys
+
+def query_positions(chain, filters, since=None, until=None, update=True):
+    """Positions of a chain's entries matching all filters and the time range
+    
+    filters maps an indexed field to the required value. Returns None when
+    there is nothing to look up (no filters and no time range). Pass
+    update=False when the caller has just brought the index up to date.
+    """
+    if not filters and not since and not until:
+        return None
+    
+    if update:
+        update_index(chain)
+    
+    positions = None
+    for field, key in filters.items():
+        matches = read_postings(chain, field, key)
+        positions = matches if positions is None else positions & matches
+        if not positions:
+            return set()
+    
+    if since or until:
+        in_range = set()
+        for key in hour_keys(chain, since, until):
+            in_range |= read_postings(chain, 'hour', key)
+        positions = in_range if positions is None else positions & in_range
+    
+    return positions
+
+def query(chain, filters, since=None, until=None):
+    """Yield a chain's entries matching filters and time range, in log order
+    
+    If an indexed position no longer holds a log entry (a segment edited in
+    place) the index is rebuilt once and the query resumes after the last
+    entry yielded.
+    """
+    last_id = 0
+    
+    for attempt in range(2):
+        positions = query_positions(chain, filters, since, until)
+        if positions is None:
+            entries = (entry for _, _, entry in logstore.iter_entries(chain=chain))
+        else:
+            entries = logstore.iter_records_at(sorted(positions), chain)
+        
+        try:
+            for entry in entries:
+                if entry['id'] <= last_id:
+                    continue
+                last_id = entry['id']
+                
+                # Hour buckets are coarse; check exact bounds (and the fields) on the entry
+                if since and entry['timestamp'] < since:
+                    continue
+                if until and entry['timestamp'] > until:
+                    continue
+                if any(entry.get(field) != key for field, key in filters.items()):
+                    continue
+                yield entry
+            return
+        
+        except ValueError as e:
+            if attempt or positions is None:
+                raise
+            print(f"Stale log index for chain {chain} ({e}); rebuilding")
+            rebuild_index(chain)
+
+if __name__ == '__main__':
+    success, message = rebuild_index()
+    print(message)
@@ -1,44 +1,46 @@
 import json
 import os
+import hmac
+import base64
+import hashlib
+import secrets
+import heapq
+import threading
+from collections import deque
 from datetime import datetime
-from hashing import create_hash_chain_entry, verify_hash_chain
+from hashing import verify_hash_chain, verify_hash_chain_parallel, ChainHashChecker
+from fileutil import write_new_file
+import logstore
+import logindex
 
-LOGS_FILE = '../logs/logs.json'
+# Verified-prefix watermark: routine verification only rehashes entries
+# appended after the last verified entry. The watermark is HMAC-protected
+# with a local key so it cannot be silently moved forward. Each chain has
+# its own watermark; exam chains keep theirs in the chain's directory.
+WATERMARK_FILE = '../logs/logs.watermark.json'
+CHAIN_WATERMARK_FILE = 'watermark.json'
+
+# Streaming export
+EXPORT_FORMATS = ('jsonl', 'csv', 'json')
+EXPORT_COMPRESSIONS = ('gzip', 'xz')
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_CSV_FIELDS = ['chain', 'id', 'event', 'user', 'exam_id', 'timestamp', 'details', 'prev_hash', 'hash']
+WATERMARK_KEY_FILE = '../config/log_watermark.key'
+
+# initialize_logs() runs on first use rather than at import time
+_logs_initialized = False
+_logs_init_lock = threading.Lock()
 
 def initialize_logs():
     """Initialize logs file if it doesn't exist"""
     try:
-        if not os.path.exists(LOGS_FILE):
-            os.makedirs(os.path.dirname(LOGS_FILE), exist_ok=True)
-            
-            # Create initial log entry
-            initial_log = {
-                "id": 1,
-                "event": "system_init",
-                "user": "system",
-                "exam_id": None,
-                "timestamp": datetime.now().isoformat(),
-                "details": "EduSecure system initialized",
-                "prev_hash": "0000",
-                "hash": ""
-            }
-            
-            # Calculate hash for initial entry
-            data_for_hash = {
-                'id': initial_log['id'],
-                'event': initial_log['event'],
-                'user': initial_log['user'],
-                'exam_id': initial_log['exam_id'],
-                'timestamp': initial_log['timestamp'],
-                'details': initial_log['details']
-            }
-            
-            initial_log['hash'] = create_hash_chain_entry(initial_log['prev_hash'], data_for_hash)
-            
-            with open(LOGS_FILE, 'w') as f:
-                json.dump([initial_log], f, indent=2)
-            
-            return True
+        # Convert a legacy logs.json array or flat logs.jsonl to segments once
+        if os.path.exists(logstore.LEGACY_LOG_FILE) or os.path.exists(logstore.FLAT_LOG_FILE):
+            success, message = logstore.migrate_legacy_logs()
+            print(message)
+        
+        # Only the first worker to start writes system_init
+        logstore.append_entry("system_init", "system", None, "EduSecure system initialized", if_empty=True)
         
         return True
         
@@ -46,148 +48,563 @@ def initialize_logs():
         print(f"Error initializing logs: {e}")
         return False
 
-def append_log(event, user, exam_id, details=""):
-    """Append a new log entry to the tamper-proof log chain"""
+def ensure_logs_initialized():
+    """Run initialize_logs() once per process (thread-safe)"""
+    global _logs_initialized
+    if _logs_initialized:
+        return
+    
+    with _logs_init_lock:
+        if not _logs_initialized:
+            _logs_initialized = initialize_logs()
+
+def append_log(event, user, exam_id, details="", wait=True):
+    """Append a new log entry to the tamper-proof log chain
+    
+    Entries are group-committed by a background writer. With wait=False the
+    call returns (True, None) without waiting for the entry to be durable.
+    """
+    ensure_logs_initialized()
+    
     try:
-        # Ensure logs file exists
-        initialize_logs()
-        
-        # Load existing logs
-        with open(LOGS_FILE, 'r') as f:
-            logs = json.load(f)
-        
-        # Get the last log entry for chaining
-        last_log = logs[-1] if logs else None
-        prev_hash = last_log['hash'] if last_log else "0000"
-        new_id = (last_log['id'] + 1) if last_log else 1
-        
-        # Create new log entry
-        new_log = {
-            "id": new_id,
-            "event": event,
-            "user": user,
-            "exam_id": exam_id,
-            "timestamp": datetime.now().isoformat(),
-            "details": details,
-            "prev_hash": prev_hash,
-            "hash": ""
-        }
-        
-        # Calculate hash for new entry
-        data_for_hash = {
-            'id': new_log['id'],
-            'event': new_log['event'],
-            'user': new_log['user'],
-            'exam_id': new_log['exam_id'],
-            'timestamp': new_log['timestamp'],
-            'details': new_log['details']
-        }
-        
-        new_log['hash'] = create_hash_chain_entry(prev_hash, data_for_hash)
-        
-        # Append to logs
-        logs.append(new_log)
-        
-        # Save updated logs
-        with open(LOGS_FILE, 'w') as f:
-            json.dump(logs, f, indent=2)
-        
+        new_log = logstore.append_entry(event, user, exam_id, details, wait)
         return True, new_log
         
     except Exception as e:
         print(f"Error appending log: {e}")
         return False, None
 
-def get_logs(limit=None, event_filter=None, user_filter=None, exam_filter=None):
+def iter_all_entries(chains=None):
+    """Stream entries of several chains (default: all) merged by timestamp"""
+    ensure_logs_initialized()
+    
+    chains = chains or logstore.list_chains()
+    streams = [(log for _, _, log in logstore.iter_entries(chain=chain)) for chain in chains]
+    return heapq.merge(*streams, key=lambda log: log['timestamp'])
+
+def log_query_scope(event_filter=None, user_filter=None, exam_filter=None):
+    """Build the index filters and the chains a log query has to read"""
+    filters = {}
+    if event_filter:
+        filters['event'] = event_filter
+    if user_filter:
+        filters['user'] = user_filter
+    if exam_filter:
+        filters['exam_id'] = exam_filter
+    
+    # An exam's events are in its own chain, plus the system chain for
+    # events recorded before per-exam chains existed
+    if exam_filter:
+        chains = [logstore.chain_for(exam_filter), logstore.SYSTEM_CHAIN]
+    else:
+        chains = logstore.list_chains()
+    
+    return filters, chains
+
+def log_sort_key(log):
+    """Total order of entries across chains: timestamp, then chain and id"""
+    return log['timestamp'], log['chain'], log['id']
+
+def iter_logs(event_filter=None, user_filter=None, exam_filter=None, since=None, until=None):
+    """Stream matching entries from all relevant chains, oldest first
+    
+    Filters and the since/until time range (ISO timestamps) are answered
+    from the log indexes, so only matching entries are read.
+    """
+    ensure_logs_initialized()
+    
+    filters, chains = log_query_scope(event_filter, user_filter, exam_filter)
+    streams = [logindex.query(chain, filters, since, until) for chain in chains]
+    return heapq.merge(*streams, key=log_sort_key)
+
+def get_logs(limit=None, event_filter=None, user_filter=None, exam_filter=None, since=None, until=None):
     """Get logs with optional filtering"""
     try:
-        if not os.path.exists(LOGS_FILE):
-            return []
-        
-        with open(LOGS_FILE, 'r') as f:
-            logs = json.load(f)
-        
-        # Apply filters
-        filtered_logs = logs
+        # Keep only the most recent `limit` matches while streaming the log
+        filtered_logs = deque(maxlen=limit) if limit else []
+        for log in iter_logs(event_filter, user_filter, exam_filter, since, until):
+            filtered_logs.append(log)
         
-        if event_filter:
-            filtered_logs = [log for log in filtered_logs if log['event'] == event_filter]
-        
-        if user_filter:
-            filtered_logs = [log for log in filtered_logs if log['user'] == user_filter]
+        return list(filtered_logs)
+    
+    except Exception as e:
+        print(f"Error getting logs: {e}")
+        return []
+
+def encode_log_cursor(log):
+    """Opaque, stable pagination cursor pointing just past an entry"""
+    return base64.urlsafe_b64encode(json.dumps(list(log_sort_key(log))).encode()).decode()
+
+def decode_log_cursor(cursor):
+    """Decode a pagination cursor into a sort key, or None if it is invalid"""
+    try:
+        timestamp, chain, entry_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(timestamp), str(chain), int(entry_id)
+    
+    except Exception:
+        return None
+
+def page_chains(chains, filters, cursor, newest_first):
+    """Chains that can hold entries of the page, each index brought up to date once
+    
+    Newest first, a chain whose first entry is newer than the cursor has
+    nothing left to show, so its index is not even updated. Otherwise
+    chains whose statistics rule out the filters or the cursor are skipped.
+    """
+    reachable = []
+    for chain in chains:
+        if cursor and newest_first:
+            state = logindex.load_index_state(chain)
+            first_entry = state['stats']['first_entry'] if state else None
+            if first_entry and first_entry > cursor[0]:
+                continue
+        
+        state = logindex.update_index(chain)
+        if state is None:
+            continue
+        
+        stats = state['stats']
+        if cursor and not newest_first and stats['last_entry'] and stats['last_entry'] < cursor[0]:
+            continue
+        if not logindex.stats_may_match(stats, filters):
+            continue
+        
+        reachable.append(chain)
+    
+    return reachable
+
+def assemble_logs_page(chains, filters, cursor, limit, newest_first):
+    """Collect one page of entries from the indexes of the given chains"""
+    chains = page_chains(chains, filters, cursor, newest_first)
+    
+    # Positions matching the filters per chain (None: every entry) and
+    # the hour buckets that hold entries from the cursor on
+    since = until = None
+    if cursor:
+        since, until = (None, cursor[0]) if newest_first else (cursor[0], None)
+    matching = {}
+    hours = set()
+    for chain in chains:
+        matching[chain] = logindex.query_positions(chain, filters, update=False)
+        hours.update(logindex.hour_keys(chain, since, until))
+    
+    page = []
+    for hour in sorted(hours, reverse=newest_first):
+        if cursor and (hour > cursor[0][:13] if newest_first else hour < cursor[0][:13]):
+            continue
+        
+        entries = []
+        for chain in chains:
+            positions = logindex.read_postings(chain, 'hour', hour)
+            if matching[chain] is not None:
+                positions &= matching[chain]
+            entries.extend(logstore.iter_records_at(sorted(positions), chain))
+        
+        entries.sort(key=log_sort_key, reverse=newest_first)
+        for log in entries:
+            key = log_sort_key(log)
+            if cursor and (key >= cursor if newest_first else key <= cursor):
+                continue
+            page.append(log)
+            if len(page) == limit:
+                break
+        
+        if len(page) == limit:
+            break
+    
+    return page
+
+def get_logs_page(limit=50, after=None, order='newest', event_filter=None, user_filter=None, exam_filter=None):
+    """Get one page of logs, newest or oldest first
+    
+    after is the next_cursor of the previous page. Pages are assembled
+    hour bucket by hour bucket from the indexes, starting at the cursor,
+    so only the entries around the page are read. If an indexed position
+    no longer holds a log entry (a segment edited in place) the indexes
+    are rebuilt once; verification reports the tampering itself.
+    """
+    ensure_logs_initialized()
+    
+    try:
+        newest_first = order == 'newest'
+        cursor = None
+        if after:
+            cursor = decode_log_cursor(after)
+            if cursor is None:
+                return {'success': False, 'error': 'Invalid cursor'}
+        
+        filters, chains = log_query_scope(event_filter, user_filter, exam_filter)
+        
+        try:
+            page = assemble_logs_page(chains, filters, cursor, limit, newest_first)
+        except ValueError as e:
+            print(f"Stale log index ({e}); rebuilding")
+            for chain in chains:
+                logindex.rebuild_index(chain)
+            page = assemble_logs_page(chains, filters, cursor, limit, newest_first)
         
-        if exam_filter:
-            filtered_logs = [log for log in filtered_logs if log['exam_id'] == exam_filter]
+        return {
+            'success': True,
+            'logs': page,
+            'next_cursor': encode_log_cursor(page[-1]) if len(page) == limit else None
+        }
+    
+    except Exception as e:
+        print(f"Error getting logs page: {e}")
+        return {'success': False, 'error': str(e)}
+
+def count_log_entries():
+    """Count entries across all chains from the chain tails (ids are contiguous)"""
+    ensure_logs_initialized()
+    
+    total = 0
+    for chain in logstore.list_chains():
+        tail = logstore.get_tail(chain)
+        if tail:
+            total += tail['id']
+    return total
+
+def get_watermark_key():
+    """Get or create the key protecting the verification watermark"""
+    if os.path.exists(WATERMARK_KEY_FILE):
+        with open(WATERMARK_KEY_FILE, 'r') as f:
+            return bytes.fromhex(f.read().strip())
+    
+    os.makedirs(os.path.dirname(WATERMARK_KEY_FILE), exist_ok=True)
+    write_new_file(WATERMARK_KEY_FILE, secrets.token_hex(32).encode())
+    
+    # Read back rather than keep the generated key: another process may have written first
+    with open(WATERMARK_KEY_FILE, 'r') as f:
+        return bytes.fromhex(f.read().strip())
+
+def watermark_path(chain=logstore.SYSTEM_CHAIN):
+    """Path of a chain's verification watermark"""
+    if chain == logstore.SYSTEM_CHAIN:
+        return WATERMARK_FILE
+    return os.path.join(logstore.chain_dir(chain), CHAIN_WATERMARK_FILE)
+
+def compute_watermark_mac(watermark, chain=logstore.SYSTEM_CHAIN):
+    """Compute the HMAC binding a watermark to its chain, verified entry and position"""
+    message = (f"{watermark['last_id']}:{watermark['last_hash']}:{watermark['segment']}:"
+               f"{watermark['entry_offset']}:{watermark['offset']}")
+    if chain != logstore.SYSTEM_CHAIN:
+        message = f"{chain}:{message}"
+    return hmac.new(get_watermark_key(), message.encode(), hashlib.sha256).hexdigest()
+
+def load_watermark(chain=logstore.SYSTEM_CHAIN):
+    """Load a chain's verified-prefix watermark, or None if missing or tampered"""
+    try:
+        path = watermark_path(chain)
+        if not os.path.exists(path):
+            return None
         
-        # Apply limit
-        if limit:
-            filtered_logs = filtered_logs[-limit:]  # Get most recent entries
+        with open(path, 'r') as f:
+            watermark = json.load(f)
         
-        return filtered_logs
+        if not hmac.compare_digest(compute_watermark_mac(watermark, chain), watermark.get('mac', '')):
+            print("Log watermark failed authentication - falling back to full verification")
+            return None
         
+        return watermark
+    
     except Exception as e:
-        print(f"Error getting logs: {e}")
-        return []
+        print(f"Error loading log watermark: {e}")
+        return None
 
-def verify_log_chain(logs=None):
-    """Verify the integrity of the log chain"""
+def save_watermark(position, chain=logstore.SYSTEM_CHAIN):
+    """Persist a chain's verified-prefix watermark at the given entry position"""
     try:
-        if logs is None:
-            if not os.path.exists(LOGS_FILE):
-                return True  # Empty log is valid
-            
-            with open(LOGS_FILE, 'r') as f:
-                logs = json.load(f)
+        watermark = {
+            'last_id': position['id'],
+            'last_hash': position['hash'],
+            'segment': position['segment'],
+            'entry_offset': position['entry_offset'],
+            'offset': position['offset'],
+            'verified_at': datetime.now().isoformat()
+        }
+        watermark['mac'] = compute_watermark_mac(watermark, chain)
         
-        return verify_hash_chain(logs)
+        # Per-process temp file so concurrent workers never share one
+        path = watermark_path(chain)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(watermark, f, indent=2)
+        os.replace(temp_path, path)
         
+        return True
+    
     except Exception as e:
-        print(f"Error verifying log chain: {e}")
+        print(f"Error saving log watermark: {e}")
         return False
 
-def get_log_statistics():
-    """Get statistics about the logs"""
+def drop_watermark(chain=logstore.SYSTEM_CHAIN):
+    """Remove a chain's watermark so its next routine check is a full verification"""
+    path = watermark_path(chain)
+    if os.path.exists(path):
+        os.remove(path)
+
+def watermark_matches_log(watermark, chain=logstore.SYSTEM_CHAIN):
+    """Check that the watermarked entry is still at its recorded position"""
     try:
-        if not os.path.exists(LOGS_FILE):
-            return {
-                'total_entries': 0,
-                'events': {},
-                'users': {},
-                'chain_valid': True
-            }
+        if not watermark:
+            return False
         
-        with open(LOGS_FILE, 'r') as f:
-            logs = json.load(f)
+        entry = logstore.read_record_at(watermark['segment'], watermark['entry_offset'], chain)
+        return entry.get('id') == watermark['last_id'] and entry.get('hash') == watermark['last_hash']
+    
+    except Exception:
+        return False
+
+def verify_segments_from(start=None, anchor_hash="0000", anchor_id=0, chain=logstore.SYSTEM_CHAIN):
+    """Verify a chain's segment headers, entries and seals from a position onwards
+    
+    Records are streamed segment by segment: links, headers and seals are
+    checked as they are read, and entries go in CHAIN_VERIFY_CHUNK_SIZE
+    batches to one shared worker pool for rehashing (see ChainHashChecker),
+    so memory stays bounded however long the chain is. Only the running
+    hash and id carry over from one batch or segment to the next.
+    Returns (valid, first_broken_id, last_position) where last_position
+    describes the last verified entry, or None if no entries were read or
+    the chain is broken.
+    """
+    checker = ChainHashChecker()
+    running_hash, running_id = anchor_hash, anchor_id
+    last_entry = None
+    
+    def scan():
+        """Read and check records; returns (failure index, broken id) for the
+        first structural or link failure, or None
+        
+        A wrong stored hash at an entry index before the failure index
+        takes precedence over it.
+        """
+        nonlocal running_hash, running_id, last_entry
+        index = 0
+        
+        for segment in logstore.list_segments(chain):
+            if start and segment < start[0]:
+                continue
+            
+            offset = start[1] if start and segment == start[0] else 0
+            seal = None
+            
+            for record_offset, end_offset, record in logstore.iter_segment_records(segment, offset, chain):
+                if checker.first_bad is not None:
+                    return None
+                
+                record_type = record.get('type')
+                
+                if record_type == 'segment_header':
+                    if record['prev_segment_hash'] != running_hash or record['prev_last_id'] != running_id:
+                        return index, running_id + 1
+                elif record_type == 'segment_seal':
+                    seal = record
+                    if (seal['final_hash'] != running_hash or seal['last_id'] != running_id or
+                            seal['count'] != seal['last_id'] - seal['first_id'] + 1):
+                        return index, seal['last_id']
+                elif seal is not None:
+                    # Nothing may follow a seal
+                    return index, record.get('id')
+                else:
+                    if record.get('prev_hash') != running_hash:
+                        return index + 1, record.get('id')
+                    
+                    checker.add(record)
+                    index += 1
+                    running_hash, running_id = record.get('hash'), record.get('id')
+                    last_entry = (segment, record_offset, end_offset)
+        
+        return None
+    
+    try:
+        failure = scan()
+        first_bad = checker.finish()
+    except Exception as e:
+        checker.close()
+        print(f"Error verifying log segments: {e}")
+        return False, None, None
+    
+    if first_bad is not None and (failure is None or first_bad < failure[0]):
+        return False, checker.first_bad_id, None
+    if failure is not None:
+        return False, failure[1], None
+    
+    if last_entry is None:
+        return True, None, None
+    
+    segment, entry_offset, offset = last_entry
+    return True, None, {
+        'id': running_id,
+        'hash': running_hash,
+        'segment': segment,
+        'entry_offset': entry_offset,
+        'offset': offset
+    }
+
+def verify_anchors():
+    """Check every chain_anchor entry against the exam chains it commits to
+    
+    Each anchored head must still be present in its chain with the same
+    hash, which catches an exam chain rewritten or truncated as a whole.
+    Returns (valid, broken_id, broken_chain).
+    """
+    expected = {}
+    for _, _, log in logstore.iter_entries():
+        if log['event'] == logstore.ANCHOR_EVENT:
+            for chain, head in log['details']['heads'].items():
+                expected.setdefault(chain, {})[head['id']] = head['hash']
+    
+    for chain, heads in expected.items():
+        for _, _, log in logstore.iter_entries(chain=chain):
+            anchored_hash = heads.pop(log['id'], None)
+            if anchored_hash is not None and anchored_hash != log['hash']:
+                return False, log['id'], chain
+        
+        if heads:
+            return False, min(heads), chain
+    
+    return True, None, None
+
+def full_verify_chain(chain=logstore.SYSTEM_CHAIN):
+    """Re-verify one chain from its first entry across CPU cores
+    
+    Returns (valid, first_broken_id). The chain's watermark is advanced to
+    its last entry on success and dropped on failure.
+    """
+    valid, first_broken_id, last_position = verify_segments_from(chain=chain)
+    
+    if not valid:
+        drop_watermark(chain)
+    elif last_position:
+        save_watermark(last_position, chain)
+    
+    return valid, first_broken_id
+
+def full_verify_log_chain(logs=None, chain=None):
+    """Re-verify the log chains in full across CPU cores
+    
+    Verifies one chain, or every chain plus the anchors when chain is None.
+    Returns (valid, first_broken_id, broken_chain). A list of entries passed
+    in is verified as a single chain.
+    """
+    try:
+        if logs is not None:
+            valid, first_broken_id = verify_hash_chain_parallel(logs)
+            return valid, first_broken_id, None
         
-        # Count events
-        events = {}
-        users = {}
+        ensure_logs_initialized()
         
-        for log in logs:
-            event = log['event']
-            user = log['user']
-            
-            events[event] = events.get(event, 0) + 1
-            users[user] = users.get(user, 0) + 1
+        for current in [chain] if chain else logstore.list_chains():
+            valid, first_broken_id = full_verify_chain(current)
+            if not valid:
+                return False, first_broken_id, current
         
-        # Verify chain integrity
-        chain_valid = verify_log_chain(logs)
+        if chain is None:
+            return verify_anchors()
         
-        return {
-            'total_entries': len(logs),
-            'events': events,
-            'users': users,
-            'chain_valid': chain_valid,
-            'first_entry': logs[0]['timestamp'] if logs else None,
-            'last_entry': logs[-1]['timestamp'] if logs else None
-        }
+        return True, None, None
+    
+    except Exception as e:
+        print(f"Error in full log chain verification: {e}")
+        return False, None, chain
+
+def verify_chain_incremental(chain=logstore.SYSTEM_CHAIN):
+    """Verify one chain from its watermark, falling back to a full check"""
+    watermark = load_watermark(chain)
+    
+    if not watermark_matches_log(watermark, chain):
+        valid, _ = full_verify_chain(chain)
+        return valid
+    
+    # Read and verify only what was appended since the watermark
+    valid, _, last_position = verify_segments_from(
+        (watermark['segment'], watermark['offset']),
+        watermark['last_hash'],
+        watermark['last_id'],
+        chain
+    )
+    
+    # Advance the watermark to the newest verified entry
+    if valid and last_position:
+        save_watermark(last_position, chain)
+    
+    return valid
+
+def verify_log_chain(logs=None, full=False, chain=None):
+    """Verify the integrity of the log chains
+    
+    Checks one chain, or every chain when chain is None. For the persisted
+    log only entries appended after each chain's verified-prefix watermark
+    are read and rehashed, so sealed segments behind it are skipped; pass
+    full=True to re-verify from system init, including the anchors. A list
+    of entries passed in is always verified in full.
+    """
+    try:
+        if logs is not None:
+            return verify_hash_chain(logs)
+        
+        ensure_logs_initialized()
         
+        if full:
+            valid, _, _ = full_verify_log_chain(chain=chain)
+            return valid
+        
+        chains = [chain] if chain else logstore.list_chains()
+        return all(verify_chain_incremental(current) for current in chains)
+    
+    except Exception as e:
+        print(f"Error verifying log chain: {e}")
+        return False
+
+def merge_stats(total, stats):
+    """Add one chain's statistics into a running total"""
+    total['total_entries'] += stats['total_entries']
+    for field in ('events', 'users', 'exams'):
+        for key, count in stats[field].items():
+            total[field][key] = total[field].get(key, 0) + count
+    
+    if stats['first_entry'] and (total['first_entry'] is None or stats['first_entry'] < total['first_entry']):
+        total['first_entry'] = stats['first_entry']
+    if stats['last_entry'] and (total['last_entry'] is None or stats['last_entry'] > total['last_entry']):
+        total['last_entry'] = stats['last_entry']
+
+def get_log_statistics(recompute=False):
+    """Get statistics about the logs
+    
+    By default the counters maintained on append are summed per chain,
+    without scanning or verifying the log. With recompute=True every entry
+    is recounted and the chains are fully verified, and the result reports
+    whether the maintained counters agree (for auditing).
+    """
+    ensure_logs_initialized()
+    
+    try:
+        maintained = logindex.new_stats()
+        for chain in logstore.list_chains():
+            merge_stats(maintained, logindex.get_stats(chain))
+        
+        if not recompute:
+            return dict(maintained, source='maintained')
+        
+        recomputed = logindex.new_stats()
+        for log in iter_all_entries():
+            logindex.add_to_stats(recomputed, log)
+        
+        chain_valid, _, _ = full_verify_log_chain()
+        
+        return dict(
+            recomputed,
+            source='recomputed',
+            chain_valid=chain_valid,
+            maintained_matches=(recomputed == maintained)
+        )
+    
     except Exception as e:
         print(f"Error getting log statistics: {e}")
         return {'error': str(e)}
 
 def get_exam_logs(exam_id):
-    """Get all logs related to a specific exam"""
+    """Get all logs related to a specific exam (reads only the exam's chain)"""
     try:
         return get_logs(exam_filter=exam_id)
         
@@ -206,51 +623,151 @@ def get_user_logs(username, limit=50):
 
 def detect_tampering():
     """Detect if logs have been tampered with"""
+    ensure_logs_initialized()
+    
     try:
-        if not os.path.exists(LOGS_FILE):
+        if not logstore.list_segments():
             return False, "No logs file found"
         
-        with open(LOGS_FILE, 'r') as f:
-            logs = json.load(f)
-        
-        chain_valid = verify_log_chain(logs)
+        chain_valid, first_broken_id, broken_chain = full_verify_log_chain()
         
         if not chain_valid:
-            return True, "Log chain integrity compromised - tampering detected"
+            return True, (f"Log chain integrity compromised - tampering detected at entry "
+                          f"{first_broken_id} of chain {broken_chain}")
         
         return False, "Log chain integrity verified - no tampering detected"
         
     except Exception as e:
         return True, f"Error detecting tampering: {e}"
 
-def export_logs(output_file, format='json'):
-    """Export logs to a file"""
+def iter_export_text(export_format='jsonl', since=None, until=None, exam_id=None):
+    """Yield an export of the matching entries as text, ending with a trailer
+    
+    Entries are streamed from the indexes one at a time. The trailer holds
+    the entry count and the verification result of the exported chains:
+    a final JSON line for jsonl, a '# '-prefixed JSON line for csv and a
+    'trailer' member for json.
+    """
+    logs = iter_logs(exam_filter=exam_id, since=since, until=until)
+    count = 0
+    
+    if export_format == 'jsonl':
+        for log in logs:
+            count += 1
+            yield json.dumps(log) + '\n'
+    
+    elif export_format == 'csv':
+        import csv
+        import io
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for log in logs:
+            count += 1
+            if not isinstance(log.get('details'), str):
+                log = dict(log, details=json.dumps(log.get('details')))
+            writer.writerow(log)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    
+    elif export_format == 'json':
+        yield '{"entries": ['
+        for log in logs:
+            yield (',\n' if count else '\n') + json.dumps(log)
+            count += 1
+        yield '\n], "trailer": '
+    
+    # Verify the chains the export was read from
+    if exam_id:
+        chains = [logstore.chain_for(exam_id), logstore.SYSTEM_CHAIN]
+        chain_valid, first_broken_id, broken_chain = True, None, None
+        for chain in chains:
+            chain_valid, first_broken_id, broken_chain = full_verify_log_chain(chain=chain)
+            if not chain_valid:
+                break
+    else:
+        chain_valid, first_broken_id, broken_chain = full_verify_log_chain()
+    
+    trailer = {
+        'type': 'export_trailer',
+        'entries': count,
+        'chain_valid': chain_valid,
+        'first_broken_id': first_broken_id,
+        'broken_chain': broken_chain,
+        'since': since,
+        'until': until,
+        'exam_id': exam_id,
+        'exported_at': datetime.now().isoformat()
+    }
+    
+    if export_format == 'jsonl':
+        yield json.dumps(trailer) + '\n'
+    elif export_format == 'csv':
+        yield '# ' + json.dumps(trailer) + '\n'
+    else:
+        yield json.dumps(trailer) + '}\n'
+
+def iter_export(export_format='jsonl', compression=None, since=None, until=None, exam_id=None):
+    """Yield an export as byte chunks, optionally gzip or xz compressed"""
+    if compression == 'gzip':
+        import zlib
+        compressor = zlib.compressobj(wbits=31)  # gzip container
+    elif compression == 'xz':
+        import lzma
+        compressor = lzma.LZMACompressor()
+    else:
+        compressor = None
+    
+    pending = []
+    pending_size = 0
+    for text in iter_export_text(export_format, since, until, exam_id):
+        pending.append(text.encode())
+        pending_size += len(pending[-1])
+        if pending_size < EXPORT_CHUNK_SIZE:
+            continue
+        
+        data = b''.join(pending)
+        pending = []
+        pending_size = 0
+        data = compressor.compress(data) if compressor else data
+        if data:
+            yield data
+    
+    data = b''.join(pending)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+def export_logs(output_file, export_format='jsonl', compression=None, since=None, until=None, exam_id=None):
+    """Stream logs to a file
+    
+    export_format is 'jsonl', 'csv' or 'json'; compression is None, 'gzip' or
+    'xz' (inferred from a .gz/.xz file name when not given). since/until
+    (ISO timestamps) and exam_id restrict what is exported.
+    """
     try:
-        if not os.path.exists(LOGS_FILE):
-            return False, "No logs to export"
-        
-        with open(LOGS_FILE, 'r') as f:
-            logs = json.load(f)
-        
-        if format.lower() == 'json':
-            with open(output_file, 'w') as f:
-                json.dump(logs, f, indent=2)
-        
-        elif format.lower() == 'csv':
-            import csv
-            with open(output_file, 'w', newline='') as f:
-                if logs:
-                    writer = csv.DictWriter(f, fieldnames=logs[0].keys())
-                    writer.writeheader()
-                    writer.writerows(logs)
-        
-        else:
-            return False, "Unsupported format. Use 'json' or 'csv'"
+        export_format = export_format.lower()
+        if export_format not in EXPORT_FORMATS:
+            return False, "Unsupported format. Use 'jsonl', 'csv' or 'json'"
+        
+        if compression is None:
+            if output_file.endswith('.gz'):
+                compression = 'gzip'
+            elif output_file.endswith('.xz'):
+                compression = 'xz'
+        if compression and compression not in EXPORT_COMPRESSIONS:
+            return False, "Unsupported compression. Use 'gzip' or 'xz'"
+        
+        temp_path = f"{output_file}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            for chunk in iter_export(export_format, compression, since, until, exam_id):
+                f.write(chunk)
+        os.replace(temp_path, output_file)
         
         return True, f"Logs exported to {output_file}"
         
     except Exception as e:
         return False, f"Error exporting logs: {e}"
-
-# Initialize logs when module is imported
-initialize_logs()
\ No newline at end of file
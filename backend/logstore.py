@@ -0,0 +1,775 @@
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from datetime import datetime, timedelta
+from urllib.parse import quote, unquote
+from hashing import create_hash_chain_entry, log_entry_hash_data
+
+# Append-only, line-delimited log store split into segments. Each entry is
+# one JSON line, so an append writes a single line. Every segment starts
+# with a header record carrying the previous segment's final hash, and a
+# closed segment ends with a seal record summarising it. Sealed segments
+# can be compressed and, once verified, skipped by routine verification.
+LOG_DIR = '../logs'
+SEGMENTS_DIR = os.path.join(LOG_DIR, 'segments')
+
+# Events are split into independent hash chains: one per exam plus the
+# system chain (logins, logouts, anchors). Each chain has its own segments,
+# tail and locks, so appends for different exams do not serialize on one
+# tail. The system chain keeps the original location under LOG_DIR; exam
+# chains live in CHAINS_DIR/<quoted exam id>/.
+SYSTEM_CHAIN = 'system'
+EXAM_CHAIN_PREFIX = 'exam:'
+CHAINS_DIR = os.path.join(LOG_DIR, 'chains')
+
+# Periodically the system chain records a chain_anchor entry committing to
+# the heads of the exam chains that moved since the previous anchor
+ANCHOR_EVENT = 'chain_anchor'
+ANCHOR_INTERVAL = 60
+
+# Earlier single-file formats, migrated into segments on first start
+FLAT_LOG_FILE = os.path.join(LOG_DIR, 'logs.jsonl')
+LEGACY_LOG_FILE = os.path.join(LOG_DIR, 'logs.json')
+
+# Rotation policy: roll to a new segment when either limit is reached
+SEGMENT_MAX_BYTES = 16 * 1024 * 1024
+SEGMENT_MAX_AGE = timedelta(days=7)
+COMPRESS_SEALED_SEGMENTS = True
+
+# Cross-process lock file, one per chain: every process appending to a
+# chain (e.g. each gunicorn worker) holds it while assigning ids and writing
+LOCK_FILE_NAME = 'logs.lock'
+
+# Size of the blocks read backwards from the end of a segment to find the tail
+TAIL_READ_BLOCK = 64 * 1024
+
+# Group commit: the background writer gathers up to this many queued events,
+# waiting at most this long for stragglers, and fsyncs once per chain per batch
+GROUP_COMMIT_MAX_BATCH = 512
+GROUP_COMMIT_WINDOW = 0.002
+
+# Threads committing the different chains of one batch concurrently
+GROUP_COMMIT_WORKERS = 8
+
+# Per-chain in-process lock and cached tail (last id/hash plus the active
+# segment's position)
+_chains = {}
+_chains_lock = threading.Lock()
+
+# Background writer state
+_queue = queue.Queue()
+_writer_thread = None
+_writer_lock = threading.Lock()
+_commit_pool = None
+_STOP = object()
+
+# Exam chains appended to by this process since its last anchor
+_dirty_chains = set()
+_last_anchor = time.monotonic()
+
+try:
+    import fcntl
+    
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+except ImportError:
+    import msvcrt
+    
+    def _lock_file(f):
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+    
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def quote_name(name):
+    """Quote a name so it is a single, safe path component"""
+    return quote(name, safe='').replace('.', '%2E')
+
+def unquote_name(name):
+    """Reverse quote_name()"""
+    return unquote(name)
+
+def chain_for(exam_id):
+    """Name of the chain that records events for an exam (or system events)"""
+    return EXAM_CHAIN_PREFIX + exam_id if exam_id else SYSTEM_CHAIN
+
+@lru_cache(maxsize=4096)
+def chain_dir(chain=SYSTEM_CHAIN):
+    """Directory holding a chain's segments and lock file"""
+    if chain == SYSTEM_CHAIN:
+        return LOG_DIR
+    
+    return os.path.join(CHAINS_DIR, quote_name(chain[len(EXAM_CHAIN_PREFIX):]))
+
+def list_chains():
+    """List all chains: the system chain first, then exam chains"""
+    chains = [SYSTEM_CHAIN]
+    
+    if os.path.exists(CHAINS_DIR):
+        for name in sorted(os.listdir(CHAINS_DIR)):
+            if os.path.isdir(os.path.join(CHAINS_DIR, name)):
+                chains.append(EXAM_CHAIN_PREFIX + unquote_name(name))
+    
+    return chains
+
+def _chain_state(chain):
+    """In-process lock and cached tail of a chain"""
+    with _chains_lock:
+        if chain not in _chains:
+            _chains[chain] = {'lock': threading.Lock(), 'tail': None}
+        return _chains[chain]
+
+@contextmanager
+def store_lock(chain=SYSTEM_CHAIN, create=False):
+    """Hold a chain's in-process lock and its cross-process file lock
+    
+    Only appends pass create=True. For a chain that was never appended to
+    there is no directory and so no file lock to take: readers get an
+    empty chain instead of leaving an empty directory behind for any
+    unknown exam id they look up.
+    """
+    with _chain_state(chain)['lock']:
+        directory = chain_dir(chain)
+        if create:
+            os.makedirs(directory, exist_ok=True)
+        elif not os.path.isdir(directory):
+            yield
+            return
+        
+        with open(os.path.join(directory, LOCK_FILE_NAME), 'a+b') as f:
+            _lock_file(f)
+            try:
+                yield
+            finally:
+                _unlock_file(f)
+
+def encode_entry(entry):
+    """Serialize a log entry or segment record as one compact JSON line"""
+    return (json.dumps(entry, separators=(',', ':')) + '\n').encode()
+
+def is_segment_record(record):
+    """Header and seal records carry a type; log entries do not"""
+    return 'type' in record
+
+def build_entry(entry_id, prev_hash, event, user, exam_id, details, timestamp=None):
+    """Create a chained log entry linked to prev_hash"""
+    entry = {
+        "id": entry_id,
+        "event": event,
+        "user": user,
+        "exam_id": exam_id,
+        "timestamp": timestamp or datetime.now().isoformat(),
+        "details": details,
+        "prev_hash": prev_hash,
+        "hash": ""
+    }
+    entry['hash'] = create_hash_chain_entry(prev_hash, log_entry_hash_data(entry))
+    return entry
+
+def build_segment_header(segment, prev_segment_hash, prev_last_id):
+    """Create the header record that opens a segment"""
+    return {
+        'type': 'segment_header',
+        'segment': segment,
+        'prev_segment_hash': prev_segment_hash,
+        'prev_last_id': prev_last_id,
+        'created': datetime.now().isoformat()
+    }
+
+def build_segment_seal(segment, first_id, last_id, final_hash):
+    """Create the seal record that closes a segment"""
+    return {
+        'type': 'segment_seal',
+        'segment': segment,
+        'count': last_id - first_id + 1 if last_id >= first_id else 0,
+        'first_id': first_id,
+        'last_id': last_id,
+        'final_hash': final_hash,
+        'sealed_at': datetime.now().isoformat()
+    }
+
+def segment_path(segment, compressed=False, chain=SYSTEM_CHAIN):
+    """Path of a segment file"""
+    name = f'segment_{segment:06d}.jsonl'
+    return os.path.join(chain_dir(chain), 'segments', name + '.gz' if compressed else name)
+
+def find_segment_file(segment, chain=SYSTEM_CHAIN):
+    """Path of an existing segment file, compressed or not, or None"""
+    for compressed in (False, True):
+        path = segment_path(segment, compressed, chain)
+        if os.path.exists(path):
+            return path
+    return None
+
+def list_segments(chain=SYSTEM_CHAIN):
+    """List segment numbers of a chain in order"""
+    segments_dir = os.path.join(chain_dir(chain), 'segments')
+    if not os.path.exists(segments_dir):
+        return []
+    
+    segments = set()
+    for file in os.listdir(segments_dir):
+        if file.startswith('segment_') and (file.endswith('.jsonl') or file.endswith('.jsonl.gz')):
+            segments.add(int(file[len('segment_'):].split('.')[0]))
+    
+    return sorted(segments)
+
+def open_segment(path):
+    """Open a segment for binary reading, decompressing sealed segments"""
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+def iter_segment_records(segment, start_offset=0, chain=SYSTEM_CHAIN):
+    """Yield (offset, end_offset, record) for every record of one segment"""
+    path = find_segment_file(segment, chain)
+    if not path:
+        return
+    
+    with open_segment(path) as f:
+        f.seek(start_offset)
+        offset = start_offset
+        for line in f:
+            # Ignore a torn trailing fragment; read_tail() will clean it up
+            if not line.endswith(b'\n'):
+                break
+            yield offset, offset + len(line), json.loads(line)
+            offset += len(line)
+
+def iter_records(start=None, chain=SYSTEM_CHAIN):
+    """Yield (segment, offset, end_offset, record) across a chain's segments
+    
+    start is an optional (segment, offset) position to resume from.
+    """
+    start_segment, start_offset = start if start else (None, 0)
+    
+    for segment in list_segments(chain):
+        if start_segment is not None and segment < start_segment:
+            continue
+        
+        offset = start_offset if segment == start_segment else 0
+        for record_offset, end_offset, record in iter_segment_records(segment, offset, chain):
+            yield segment, record_offset, end_offset, record
+
+def iter_entries(start=None, chain=SYSTEM_CHAIN):
+    """Yield (segment, offset, entry) for each log entry of a chain
+    
+    Segment records are skipped and each entry is tagged with its chain
+    (not part of the hashed data).
+    """
+    for segment, offset, _, record in iter_records(start, chain):
+        if not is_segment_record(record):
+            record.setdefault('chain', chain)
+            yield segment, offset, record
+
+def read_record_at(segment, offset, chain=SYSTEM_CHAIN):
+    """Read the single record whose line starts at offset in a segment"""
+    with open_segment(find_segment_file(segment, chain)) as f:
+        f.seek(offset)
+        return json.loads(f.readline())
+
+def iter_records_at(positions, chain=SYSTEM_CHAIN):
+    """Yield the entries at sorted (segment, offset) positions of a chain
+    
+    Each segment is opened once and read forwards. Raises ValueError if a
+    position does not start a log entry (e.g. a stale index position).
+    """
+    f = None
+    current = None
+    
+    try:
+        for segment, offset in positions:
+            if segment != current:
+                if f:
+                    f.close()
+                f = open_segment(find_segment_file(segment, chain))
+                current = segment
+            
+            f.seek(offset)
+            entry = json.loads(f.readline())
+            if not isinstance(entry, dict) or is_segment_record(entry):
+                raise ValueError(f"No log entry at segment {segment} offset {offset} of chain {chain}")
+            entry.setdefault('chain', chain)
+            yield entry
+    finally:
+        if f:
+            f.close()
+
+def read_all_entries(chain=SYSTEM_CHAIN):
+    """Load every log entry of a chain into a list"""
+    return [entry for _, _, entry in iter_entries(chain=chain)]
+
+def read_segment_header(segment, chain=SYSTEM_CHAIN):
+    """Read the header record of a segment"""
+    for _, _, record in iter_segment_records(segment, 0, chain):
+        return record
+    return None
+
+def read_last_line(path):
+    """Return (offset, line) of the last complete line of an uncompressed file
+    
+    A trailing fragment without a newline (a write torn by a crash) was
+    never acknowledged, so it is truncated away.
+    """
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        
+        # Read backwards until the buffer holds the last complete line
+        buffer = b''
+        position = size
+        while position > 0:
+            read_size = min(TAIL_READ_BLOCK, position)
+            position -= read_size
+            f.seek(position)
+            buffer = f.read(read_size) + buffer
+            if buffer.count(b'\n') >= 2 or (position == 0 and b'\n' in buffer):
+                break
+        
+        end = buffer.rfind(b'\n')
+        torn = len(buffer) - end - 1
+        
+        if torn:
+            print(f"Truncating {torn} bytes of torn log data from {path}")
+            f.truncate(size - torn)
+        
+        if end == -1:
+            return None, None
+        
+        start = buffer.rfind(b'\n', 0, end) + 1
+        return position + start, buffer[start:end + 1]
+
+def read_tail(chain=SYSTEM_CHAIN):
+    """Recover a chain's tail from the header and last line of its newest segment"""
+    segments = list_segments(chain)
+    if not segments:
+        return None
+    
+    segment = segments[-1]
+    path = find_segment_file(segment, chain)
+    header = read_segment_header(segment, chain)
+    
+    if path.endswith('.gz'):
+        # A compressed segment is always sealed
+        last_record = None
+        for _, _, record in iter_segment_records(segment, 0, chain):
+            last_record = record
+        entry_offset = None
+        offset = None
+    else:
+        entry_offset, line = read_last_line(path)
+        last_record = json.loads(line) if line else None
+        offset = entry_offset + len(line) if line else 0
+    
+    tail = {
+        'segment': segment,
+        'segment_created': header['created'] if header else datetime.now().isoformat(),
+        'segment_first_id': (header['prev_last_id'] + 1) if header else 1,
+        'entry_offset': entry_offset,
+        'offset': offset,
+        'sealed': False
+    }
+    
+    if last_record is None or last_record.get('type') == 'segment_header':
+        # Empty segment: the chain continues from the previous segment
+        tail['id'] = header['prev_last_id'] if header else 0
+        tail['hash'] = header['prev_segment_hash'] if header else "0000"
+    elif last_record.get('type') == 'segment_seal':
+        tail['id'] = last_record['last_id']
+        tail['hash'] = last_record['final_hash']
+        tail['sealed'] = True
+    else:
+        tail['id'] = last_record['id']
+        tail['hash'] = last_record['hash']
+    
+    return tail
+
+def refresh_tail(chain=SYSTEM_CHAIN):
+    """Re-read a chain's tail if another process appended or rotated since it was cached
+    
+    Must be called with store_lock(chain) held. The active segment only
+    grows while the lock is held, so an unchanged size means the cache is
+    current.
+    """
+    state = _chain_state(chain)
+    tail = state['tail']
+    
+    if tail is not None:
+        try:
+            if os.path.getsize(segment_path(tail['segment'], chain=chain)) == tail['offset']:
+                return tail
+        except OSError:
+            pass
+    
+    state['tail'] = read_tail(chain)
+    return state['tail']
+
+def should_rotate(tail):
+    """Check whether the active segment has reached its size or age limit"""
+    if tail['sealed']:
+        return True
+    
+    if tail['offset'] >= SEGMENT_MAX_BYTES:
+        return True
+    
+    created = datetime.fromisoformat(tail['segment_created'])
+    return datetime.now() - created >= SEGMENT_MAX_AGE and tail['id'] >= tail['segment_first_id']
+
+def compress_segment(segment, chain=SYSTEM_CHAIN):
+    """Gzip a sealed segment and remove the uncompressed file"""
+    path = segment_path(segment, chain=chain)
+    compressed_path = segment_path(segment, True, chain)
+    temp_path = compressed_path + '.tmp'
+    
+    with open(path, 'rb') as src, gzip.open(temp_path, 'wb') as dst:
+        for chunk in iter(lambda: src.read(1024 * 1024), b""):
+            dst.write(chunk)
+    
+    os.replace(temp_path, compressed_path)
+    os.remove(path)
+
+def start_segment(segment, prev_segment_hash, prev_last_id, chain=SYSTEM_CHAIN):
+    """Create a new segment file containing only its header; returns the tail"""
+    os.makedirs(os.path.join(chain_dir(chain), 'segments'), exist_ok=True)
+    header = build_segment_header(segment, prev_segment_hash, prev_last_id)
+    line = encode_entry(header)
+    
+    with open(segment_path(segment, chain=chain), 'xb') as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+    
+    return {
+        'id': prev_last_id,
+        'hash': prev_segment_hash,
+        'segment': segment,
+        'segment_created': header['created'],
+        'segment_first_id': prev_last_id + 1,
+        'entry_offset': None,
+        'offset': len(line),
+        'sealed': False
+    }
+
+def rotate_segment(tail, chain=SYSTEM_CHAIN):
+    """Seal the active segment, optionally compress it and open the next one"""
+    segment = tail['segment']
+    
+    if not tail['sealed']:
+        seal = build_segment_seal(segment, tail['segment_first_id'], tail['id'], tail['hash'])
+        with open(segment_path(segment, chain=chain), 'ab') as f:
+            f.write(encode_entry(seal))
+            f.flush()
+            os.fsync(f.fileno())
+    
+    if COMPRESS_SEALED_SEGMENTS and os.path.exists(segment_path(segment, chain=chain)):
+        compress_segment(segment, chain)
+    
+    return start_segment(segment + 1, tail['hash'], tail['id'], chain)
+
+def rotate_now(chain=SYSTEM_CHAIN):
+    """Seal a chain's active segment immediately (e.g. before an archive or export)"""
+    with store_lock(chain):
+        tail = refresh_tail(chain)
+        if tail is None:
+            return False
+        _chain_state(chain)['tail'] = rotate_segment(tail, chain)
+        return True
+
+def get_tail(chain=SYSTEM_CHAIN):
+    """Get a chain's current tail, re-reading it from disk if it is stale"""
+    with store_lock(chain):
+        tail = refresh_tail(chain)
+        return dict(tail) if tail else None
+
+def commit_chain_batch(chain, batch):
+    """Assign ids and chain hashes to one chain's queued events in order and write them
+    
+    All lines are written together and fsynced once (twice if the batch
+    crosses a segment rotation), then indexed and added to the Merkle tree.
+    """
+    state = _chain_state(chain)
+    
+    with store_lock(chain, create=True):
+        if refresh_tail(chain) is None:
+            state['tail'] = start_segment(1, "0000", 0, chain)
+        tail = state['tail']
+        start = (tail['segment'], tail['offset'])
+        written = []
+        
+        f = None
+        try:
+            for item in batch:
+                if item['if_empty'] and tail['id'] > 0:
+                    item['entry'] = None
+                    continue
+                
+                if should_rotate(tail):
+                    if f:
+                        f.flush()
+                        os.fsync(f.fileno())
+                        f.close()
+                        f = None
+                    tail = state['tail'] = rotate_segment(tail, chain)
+                
+                if f is None:
+                    f = open(segment_path(tail['segment'], chain=chain), 'ab')
+                
+                entry = build_entry(tail['id'] + 1, tail['hash'], item['event'], item['user'],
+                                    item['exam_id'], item['details'], item['timestamp'])
+                line = encode_entry(entry)
+                entry_offset = f.tell()
+                f.write(line)
+                
+                tail.update({
+                    'id': entry['id'],
+                    'hash': entry['hash'],
+                    'entry_offset': entry_offset,
+                    'offset': entry_offset + len(line)
+                })
+                written.append((tail['segment'], entry_offset, entry))
+                entry['chain'] = chain
+                item['entry'] = entry
+            
+            if f:
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            if f:
+                f.close()
+        
+        # The entries are durable; an indexing or Merkle tree failure is
+        # repaired on the next catch-up
+        if written:
+            try:
+                import logindex
+                logindex.index_batch(chain, start, written, (tail['segment'], tail['offset']))
+            except Exception as e:
+                print(f"Error indexing log batch for chain {chain}: {e}")
+            
+            try:
+                import merkle
+                merkle.append_entries_locked(chain, [entry for _, _, entry in written])
+            except Exception as e:
+                print(f"Error updating Merkle tree for chain {chain}: {e}")
+
+def get_commit_pool():
+    """Thread pool committing the chains of a batch concurrently (created on first use)"""
+    global _commit_pool
+    
+    if _commit_pool is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _commit_pool = ThreadPoolExecutor(GROUP_COMMIT_WORKERS, thread_name_prefix='log-commit')
+    return _commit_pool
+
+def commit_chain_items(chain, items):
+    """Commit one chain's share of a batch; on failure the error is attached to its items"""
+    try:
+        commit_chain_batch(chain, items)
+        return True
+    except Exception as e:
+        print(f"Error committing log batch for chain {chain}: {e}")
+        for item in items:
+            item['error'] = e
+        return False
+
+def commit_batch(batch):
+    """Group queued events by chain and commit each chain's events in order
+    
+    Chains share no files or locks, so when a batch spans several they are
+    committed concurrently and their fsyncs, index and Merkle updates
+    overlap instead of queueing behind each other.
+    """
+    by_chain = {}
+    for item in batch:
+        by_chain.setdefault(item['chain'], []).append(item)
+    
+    results = None
+    if len(by_chain) > 1:
+        try:
+            results = list(get_commit_pool().map(commit_chain_items, by_chain.keys(), by_chain.values()))
+        except RuntimeError:
+            # The pool is shut down before atexit runs the final flush
+            pass
+    if results is None:
+        results = [commit_chain_items(chain, items) for chain, items in by_chain.items()]
+    
+    for chain, committed in zip(by_chain, results):
+        if committed and chain != SYSTEM_CHAIN:
+            _dirty_chains.add(chain)
+
+def make_item(event, user, exam_id, details, if_empty=False):
+    """Build a queued append request"""
+    return {
+        'chain': chain_for(exam_id),
+        'event': event,
+        'user': user,
+        'exam_id': exam_id,
+        'details': details,
+        'timestamp': datetime.now().isoformat(),
+        'if_empty': if_empty,
+        'done': threading.Event()
+    }
+
+def anchor_chains():
+    """Append a chain_anchor entry to the system chain committing to the
+    current heads of the exam chains appended to since the last anchor
+    
+    Returns the anchor entry, or None if no exam chain has moved.
+    """
+    global _last_anchor
+    
+    chains = sorted(_dirty_chains)
+    _dirty_chains.clear()
+    _last_anchor = time.monotonic()
+    
+    heads = {}
+    for chain in chains:
+        tail = get_tail(chain)
+        if tail:
+            heads[chain] = {'id': tail['id'], 'hash': tail['hash']}
+    
+    if not heads:
+        return None
+    
+    item = make_item(ANCHOR_EVENT, 'system', None, {'heads': heads})
+    commit_batch([item])
+    return item.get('entry')
+
+def _writer_loop():
+    """Background writer: drain the queue in batches, group-commit them and
+    periodically anchor the exam chains"""
+    while True:
+        try:
+            item = _queue.get(timeout=ANCHOR_INTERVAL)
+        except queue.Empty:
+            item = None
+        
+        stop = item is _STOP
+        batch = [item] if item is not None and not stop else []
+        
+        while batch and len(batch) < GROUP_COMMIT_MAX_BATCH:
+            try:
+                item = _queue.get(timeout=GROUP_COMMIT_WINDOW)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        
+        if batch:
+            commit_batch(batch)
+            for item in batch:
+                item['done'].set()
+        
+        # Anchor on schedule, and always before stopping
+        if _dirty_chains and (stop or time.monotonic() - _last_anchor >= ANCHOR_INTERVAL):
+            try:
+                anchor_chains()
+            except Exception as e:
+                print(f"Error anchoring log chains: {e}")
+        
+        if stop:
+            return
+
+def start_writer():
+    """Start the background log writer if it is not already running"""
+    global _writer_thread
+    
+    with _writer_lock:
+        if _writer_thread and _writer_thread.is_alive():
+            return
+        
+        _writer_thread = threading.Thread(target=_writer_loop, name='log-writer', daemon=True)
+        _writer_thread.start()
+
+def stop_writer(timeout=None):
+    """Flush queued events, anchor pending exam chains and stop the background writer"""
+    with _writer_lock:
+        if _writer_thread and _writer_thread.is_alive():
+            _queue.put(_STOP)
+            _writer_thread.join(timeout)
+
+# Don't lose fire-and-forget events queued just before interpreter exit
+atexit.register(stop_writer)
+
+def append_entry(event, user, exam_id, details="", wait=True, if_empty=False):
+    """Queue one event for the background writer
+    
+    The event goes to its exam's chain, or the system chain when exam_id
+    is empty. With wait=True (default) this blocks until the entry's batch
+    has been fsynced and returns the chained entry. With wait=False it
+    returns None immediately and the entry is written with the next group
+    commit. With if_empty=True the event is only written if the chain has
+    no entries yet (so concurrently starting workers write a single
+    system_init).
+    """
+    start_writer()
+    
+    item = make_item(event, user, exam_id, details, if_empty)
+    _queue.put(item)
+    
+    if not wait:
+        return None
+    
+    item['done'].wait()
+    if 'error' in item:
+        raise item['error']
+    
+    return item['entry']
+
+def migrate_legacy_logs():
+    """Move a legacy logs.json array or flat logs.jsonl into segment 1 of the
+    system chain (one-shot)
+    
+    The legacy file is kept with a .migrated suffix for reference.
+    """
+    with store_lock():
+        # Checked under the lock: another worker may have just migrated
+        if list_segments():
+            return False, "Segmented log already exists; not migrating"
+        
+        if os.path.exists(LEGACY_LOG_FILE):
+            source = LEGACY_LOG_FILE
+            with open(LEGACY_LOG_FILE, 'r') as f:
+                entries = json.load(f)
+        elif os.path.exists(FLAT_LOG_FILE):
+            source = FLAT_LOG_FILE
+            with open(FLAT_LOG_FILE, 'rb') as f:
+                entries = [json.loads(line) for line in f if line.endswith(b'\n')]
+        else:
+            return False, "No legacy logs to migrate"
+        
+        os.makedirs(SEGMENTS_DIR, exist_ok=True)
+        temp_path = segment_path(1) + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(encode_entry(build_segment_header(1, "0000", 0)))
+            for entry in entries:
+                f.write(encode_entry(entry))
+            f.flush()
+            os.fsync(f.fileno())
+        
+        os.replace(temp_path, segment_path(1))
+        os.replace(source, source + '.migrated')
+        _chain_state(SYSTEM_CHAIN)['tail'] = None
+    
+    return True, f"Migrated {len(entries)} log entries from {source} to {SEGMENTS_DIR}"
+
+if __name__ == '__main__':
+    success, message = migrate_legacy_logs()
+    print(message)
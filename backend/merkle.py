@@ -0,0 +1,394 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+import logstore
+from fileutil import write_new_file
+
+# Merkle tree over each log chain, kept alongside the hash chain so that an
+# auditor can check that one entry is in the log (inclusion proof) or that
+# a later log extends an earlier one (consistency proof) with O(log n)
+# hashes instead of replaying the chain. Hashing follows RFC 6962: a leaf is
+# SHA256(0x00 || entry hash) and an interior node SHA256(0x01 || left || right).
+#
+# Every complete, aligned subtree is stored: <chain dir>/merkle/level_KK.bin
+# holds the 32-byte hashes of the subtrees of 2**KK leaves, in order. Leaf i
+# is the entry with id i + 1. The tree is appended to under the chain's lock
+# after each group commit and can be rebuilt from the log at any time.
+MERKLE_DIR_NAME = 'merkle'
+NODE_SIZE = 32
+
+# Tree heads are signed with their own RSA key, created on first use, so the
+# admin key that unwraps chaos keys is never used to sign. Each tree head
+# names its signing key by id: the first 16 hex digits of SHA-256 over the
+# DER public key.
+TREE_SIGNING_KEY_FILE = '../config/tree_signing_key.pem'
+
+# Per-process cache of the signing key: (key id, private key)
+_signing_key_cache = None
+_signing_key_lock = threading.Lock()
+
+def leaf_hash(entry_hash):
+    """Merkle leaf hash of a log entry, from its chain hash"""
+    return hashlib.sha256(b'\x00' + entry_hash.encode()).digest()
+
+def node_hash(left, right):
+    """Merkle interior node hash"""
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+def merkle_dir(chain=logstore.SYSTEM_CHAIN):
+    """Directory holding a chain's Merkle tree"""
+    return os.path.join(logstore.chain_dir(chain), MERKLE_DIR_NAME)
+
+def level_path(chain, level):
+    """Path of the file holding one level of complete subtrees"""
+    return os.path.join(merkle_dir(chain), f'level_{level:02d}.bin')
+
+def level_count(chain, level):
+    """Number of complete nodes stored at a level"""
+    try:
+        return os.path.getsize(level_path(chain, level)) // NODE_SIZE
+    except OSError:
+        return 0
+
+def tree_size(chain=logstore.SYSTEM_CHAIN):
+    """Number of leaves in a chain's tree"""
+    return level_count(chain, 0)
+
+def read_node(chain, level, index):
+    """Hash of the complete subtree of 2**level leaves starting at leaf index * 2**level
+    
+    A node not written yet (an append in progress) is computed from its children.
+    """
+    try:
+        with open(level_path(chain, level), 'rb') as f:
+            f.seek(index * NODE_SIZE)
+            node = f.read(NODE_SIZE)
+        if len(node) == NODE_SIZE:
+            return node
+    except OSError:
+        pass
+    
+    if level == 0:
+        raise ValueError(f"Leaf {index} is not in the Merkle tree of chain {chain}")
+    
+    return node_hash(read_node(chain, level - 1, 2 * index), read_node(chain, level - 1, 2 * index + 1))
+
+def largest_power_of_two_below(n):
+    """Largest power of two strictly less than n (n > 1)"""
+    k = 1
+    while k * 2 < n:
+        k *= 2
+    return k
+
+def subtree_hash(chain, start, end):
+    """Merkle tree hash (MTH) of leaves [start, end)"""
+    size = end - start
+    if size <= 0:
+        return hashlib.sha256(b'').digest()
+    
+    # A complete, aligned subtree is stored directly
+    if size & (size - 1) == 0 and start % size == 0:
+        return read_node(chain, size.bit_length() - 1, start // size)
+    
+    k = largest_power_of_two_below(size)
+    return node_hash(subtree_hash(chain, start, start + k), subtree_hash(chain, start + k, end))
+
+def append_leaves(chain, leaves):
+    """Append leaf hashes and complete any subtrees they finish"""
+    try:
+        f = open(level_path(chain, 0), 'ab')
+    except FileNotFoundError:
+        os.makedirs(merkle_dir(chain), exist_ok=True)
+        f = open(level_path(chain, 0), 'ab')
+    
+    with f:
+        f.write(b''.join(leaves))
+    
+    level = 0
+    count = level_count(chain, 0)
+    while count > 1:
+        parents = level_count(chain, level + 1)
+        new_nodes = [
+            node_hash(read_node(chain, level, 2 * i), read_node(chain, level, 2 * i + 1))
+            for i in range(parents, count // 2)
+        ]
+        if new_nodes:
+            with open(level_path(chain, level + 1), 'ab') as f:
+                f.write(b''.join(new_nodes))
+        level += 1
+        count //= 2
+
+def truncate_torn_levels(chain):
+    """Drop partial nodes left by an interrupted append"""
+    level = 0
+    while os.path.exists(level_path(chain, level)):
+        path = level_path(chain, level)
+        size = os.path.getsize(path)
+        if size % NODE_SIZE:
+            with open(path, 'rb+') as f:
+                f.truncate(size - size % NODE_SIZE)
+        level += 1
+
+def sync_tree_locked(chain):
+    """Add log entries missing from the tree (must hold logstore.store_lock(chain))"""
+    truncate_torn_levels(chain)
+    size = tree_size(chain)
+    
+    leaves = []
+    last_id = 0
+    for _, _, entry in logstore.iter_entries(chain=chain):
+        last_id = entry['id']
+        if entry['id'] > size:
+            leaves.append(leaf_hash(entry['hash']))
+    
+    # More leaves than entries: the tree belongs to another log, start over
+    if size > last_id:
+        shutil.rmtree(merkle_dir(chain), ignore_errors=True)
+        return sync_tree_locked(chain)
+    
+    if leaves:
+        append_leaves(chain, leaves)
+
+def append_entries_locked(chain, entries):
+    """Add just-committed entries to the tree (called by logstore under the chain lock)
+    
+    If the tree does not end right before the batch (first use, or a crash
+    between a commit and this update) it catches up from the log instead.
+    """
+    if tree_size(chain) != entries[0]['id'] - 1:
+        sync_tree_locked(chain)
+        return
+    
+    append_leaves(chain, [leaf_hash(entry['hash']) for entry in entries])
+
+def update_tree(chain=logstore.SYSTEM_CHAIN):
+    """Bring a chain's tree up to date with the log; returns its size"""
+    with logstore.store_lock(chain):
+        tail = logstore.refresh_tail(chain)
+        if tail and tree_size(chain) != tail['id']:
+            sync_tree_locked(chain)
+        return tree_size(chain)
+
+def rebuild_tree(chain=None):
+    """Rebuild the Merkle tree of one chain (or all chains) from the log"""
+    try:
+        chains = [chain] if chain else logstore.list_chains()
+        
+        for current in chains:
+            with logstore.store_lock(current):
+                shutil.rmtree(merkle_dir(current), ignore_errors=True)
+                sync_tree_locked(current)
+        
+        return True, f"Rebuilt Merkle trees for {len(chains)} chain(s)"
+    
+    except Exception as e:
+        return False, f"Error rebuilding Merkle trees: {e}"
+
+def tree_head_message(tree_head):
+    """Canonical bytes covered by a tree head signature"""
+    fields = {key: tree_head[key] for key in ('chain', 'tree_size', 'root_hash', 'timestamp', 'key_id')}
+    return json.dumps(fields, sort_keys=True, separators=(',', ':')).encode()
+
+def signing_key_id(public_key):
+    """Id of a tree head signing key"""
+    return hashlib.sha256(public_key.export_key(format='DER')).hexdigest()[:16]
+
+def get_tree_signing_key():
+    """Get or create the tree head signing key as (key id, private key)"""
+    global _signing_key_cache
+    
+    cache = _signing_key_cache
+    if cache:
+        return cache
+    
+    from Crypto.PublicKey import RSA
+    
+    with _signing_key_lock:
+        if _signing_key_cache is None:
+            if not os.path.exists(TREE_SIGNING_KEY_FILE):
+                os.makedirs(os.path.dirname(TREE_SIGNING_KEY_FILE), exist_ok=True)
+                write_new_file(TREE_SIGNING_KEY_FILE, RSA.generate(2048).export_key())
+            
+            # Read back rather than keep the generated key: another process may have written first
+            with open(TREE_SIGNING_KEY_FILE, 'rb') as f:
+                private_key = RSA.import_key(f.read())
+            _signing_key_cache = (signing_key_id(private_key.publickey()), private_key)
+        
+        return _signing_key_cache
+
+def get_signed_tree_head(chain=logstore.SYSTEM_CHAIN):
+    """Current tree head of a chain signed with the tree signing key"""
+    from Crypto.Hash import SHA256
+    from Crypto.Signature import pkcs1_15
+    
+    key_id, private_key = get_tree_signing_key()
+    size = update_tree(chain)
+    tree_head = {
+        'chain': chain,
+        'tree_size': size,
+        'root_hash': subtree_hash(chain, 0, size).hex(),
+        'timestamp': datetime.now().isoformat(),
+        'key_id': key_id
+    }
+    
+    signature = pkcs1_15.new(private_key).sign(SHA256.new(tree_head_message(tree_head)))
+    tree_head['signature'] = signature.hex()
+    
+    return tree_head
+
+def verify_tree_head(tree_head, public_key):
+    """Check a signed tree head against the tree signing public key"""
+    from Crypto.Hash import SHA256
+    from Crypto.Signature import pkcs1_15
+    
+    try:
+        if tree_head['key_id'] != signing_key_id(public_key):
+            return False
+        pkcs1_15.new(public_key).verify(SHA256.new(tree_head_message(tree_head)),
+                                        bytes.fromhex(tree_head['signature']))
+        return True
+    except (ValueError, TypeError, KeyError):
+        return False
+
+def inclusion_path(chain, index, start, end):
+    """RFC 6962 PATH(index, D[start:end]) as a list of node hashes"""
+    size = end - start
+    if size <= 1:
+        return []
+    
+    k = largest_power_of_two_below(size)
+    if index < k:
+        return inclusion_path(chain, index, start, start + k) + [subtree_hash(chain, start + k, end)]
+    return inclusion_path(chain, index - k, start + k, end) + [subtree_hash(chain, start, start + k)]
+
+def consistency_path(chain, m, start, end, complete):
+    """RFC 6962 SUBPROOF(m, D[start:end], complete) as a list of node hashes"""
+    size = end - start
+    if m == size:
+        return [] if complete else [subtree_hash(chain, start, end)]
+    
+    k = largest_power_of_two_below(size)
+    if m <= k:
+        return consistency_path(chain, m, start, start + k, complete) + [subtree_hash(chain, start + k, end)]
+    return consistency_path(chain, m - k, start + k, end, False) + [subtree_hash(chain, start, start + k)]
+
+def get_inclusion_proof(chain, entry_id, size=None):
+    """Inclusion proof of one entry in a tree of the given size (default: current)"""
+    try:
+        current_size = update_tree(chain)
+        size = size or current_size
+        index = entry_id - 1
+        
+        if not 0 < size <= current_size:
+            return {'success': False, 'error': f'Tree size must be between 1 and {current_size}'}
+        if not 0 <= index < size:
+            return {'success': False, 'error': f'Entry {entry_id} is not in a tree of size {size}'}
+        
+        return {
+            'success': True,
+            'chain': chain,
+            'entry_id': entry_id,
+            'leaf_index': index,
+            'tree_size': size,
+            'leaf_hash': read_node(chain, 0, index).hex(),
+            'root_hash': subtree_hash(chain, 0, size).hex(),
+            'audit_path': [node.hex() for node in inclusion_path(chain, index, 0, size)]
+        }
+    
+    except Exception as e:
+        print(f"Error building inclusion proof: {e}")
+        return {'success': False, 'error': str(e)}
+
+def get_consistency_proof(chain, first_size, second_size=None):
+    """Proof that the tree of first_size is a prefix of the tree of second_size"""
+    try:
+        current_size = update_tree(chain)
+        second_size = second_size or current_size
+        
+        if not 0 < first_size <= second_size <= current_size:
+            return {'success': False,
+                    'error': f'Sizes must satisfy 0 < first <= second <= {current_size}'}
+        
+        proof = [] if first_size == second_size else consistency_path(chain, first_size, 0, second_size, True)
+        
+        return {
+            'success': True,
+            'chain': chain,
+            'first_size': first_size,
+            'second_size': second_size,
+            'first_root': subtree_hash(chain, 0, first_size).hex(),
+            'second_root': subtree_hash(chain, 0, second_size).hex(),
+            'proof': [node.hex() for node in proof]
+        }
+    
+    except Exception as e:
+        print(f"Error building consistency proof: {e}")
+        return {'success': False, 'error': str(e)}
+
+def verify_inclusion(leaf, index, size, audit_path, root):
+    """Check an inclusion proof (RFC 9162 2.1.3.2); hashes are hex strings"""
+    if index >= size:
+        return False
+    
+    fn, sn = index, size - 1
+    result = bytes.fromhex(leaf)
+    
+    for node in audit_path:
+        node = bytes.fromhex(node)
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            result = node_hash(node, result)
+            if not fn & 1:
+                while fn & 1 == 0 and fn != 0:
+                    fn >>= 1
+                    sn >>= 1
+        else:
+            result = node_hash(result, node)
+        fn >>= 1
+        sn >>= 1
+    
+    return sn == 0 and result.hex() == root
+
+def verify_consistency(first_size, second_size, first_root, second_root, proof):
+    """Check a consistency proof (RFC 9162 2.1.4.2); hashes are hex strings"""
+    if first_size == second_size:
+        return first_root == second_root and not proof
+    if not 0 < first_size < second_size or not proof:
+        return False
+    
+    path = [bytes.fromhex(node) for node in proof]
+    
+    # A power-of-two first tree is itself a node of the second tree
+    if first_size & (first_size - 1) == 0:
+        path.insert(0, bytes.fromhex(first_root))
+    
+    fn, sn = first_size - 1, second_size - 1
+    while fn & 1:
+        fn >>= 1
+        sn >>= 1
+    
+    fr = sr = path[0]
+    for node in path[1:]:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            fr = node_hash(node, fr)
+            sr = node_hash(node, sr)
+            if not fn & 1:
+                while fn & 1 == 0 and fn != 0:
+                    fn >>= 1
+                    sn >>= 1
+        else:
+            sr = node_hash(sr, node)
+        fn >>= 1
+        sn >>= 1
+    
+    return sn == 0 and fr.hex() == first_root and sr.hex() == second_root
+
+if __name__ == '__main__':
+    success, message = rebuild_tree()
+    print(message)
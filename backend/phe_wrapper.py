@@ -1,44 +1,204 @@
 from phe import paillier
+from phe.util import invert, powmod
+import atexit
 import json
 import os
-import pickle
+import queue
+import threading
 from datetime import datetime
+from fileutil import write_new_file
 
-# Global key pair (in production, store securely)
+# Paillier keys are stored as plain integers (n, p, q) in a versioned JSON
+# file; the private key's CRT values are recomputed on load. Keys from the
+# old pickle file are migrated once.
+PHE_KEYS_FILE = '../config/phe_keys.json'
+LEGACY_PHE_KEYS_FILE = '../config/phe_keys.pkl'
+PHE_KEYS_VERSION = 1
+
+# Global key pair (in production, store securely). Loaded (or generated) on
+# first use rather than at import time.
 PUBLIC_KEY = None
 PRIVATE_KEY = None
+_phe_keys_lock = threading.Lock()
+
+# Pool of precomputed obfuscators r^n mod n^2, the modular exponentiation
+# that dominates Paillier encryption. A separate low-priority process
+# computes them into a bounded queue, so the exponentiations never hold
+# this process's GIL; encryptions fall back to computing one when the
+# queue is empty.
+DEFAULT_OBFUSCATOR_POOL_SIZE = 64
+OBFUSCATOR_WORKER_NICE = 10
+
+_obfuscator_queue = None
+_obfuscator_process = None
+_obfuscator_pool_lock = threading.Lock()
+
+# Access counter increments not yet written to metadata.json:
+# {(upload_folder, exam_id): delta}. Flushed on the next persisting
+# increment of that exam, by flush_counter_increments() and at exit.
+_pending_increments = {}
+_counter_lock = threading.RLock()
+
+class PaillierPrivateKey(paillier.PaillierPrivateKey):
+    """Paillier private key whose CRT values are cheap to rebuild on load
+    
+    phe always uses g = n + 1, so g^(x-1) mod x^2 = 1 + (x-1)*n mod x^2
+    (binomial theorem; x^2 divides n^2 for x = p or q). This replaces the
+    two full modular exponentiations of the stock h function.
+    """
+    
+    def h_function(self, x, xsquare):
+        return invert(self.l_function((1 + (x - 1) * self.public_key.n) % xsquare, x), x)
+
+def serialize_phe_keys(public_key, private_key):
+    """Key file contents for a Paillier key pair"""
+    return json.dumps({
+        'version': PHE_KEYS_VERSION,
+        'n': format(public_key.n, 'x'),
+        'p': format(private_key.p, 'x'),
+        'q': format(private_key.q, 'x')
+    }, indent=2).encode()
+
+def load_phe_keys(keys_file=PHE_KEYS_FILE):
+    """Read a Paillier key pair from a key file"""
+    with open(keys_file, 'r') as f:
+        keys = json.load(f)
+    
+    if keys.get('version') != PHE_KEYS_VERSION:
+        raise ValueError(f"Unsupported Paillier key file version {keys.get('version')}")
+    
+    # Hex parsing is linear and not subject to int() digit limits
+    public_key = paillier.PaillierPublicKey(int(keys['n'], 16))
+    private_key = PaillierPrivateKey(public_key, int(keys['p'], 16), int(keys['q'], 16))
+    return public_key, private_key
+
+def save_phe_keys(public_key, private_key, keys_file=PHE_KEYS_FILE):
+    """Write a new key file (0600) unless one exists; returns True if written"""
+    os.makedirs(os.path.dirname(keys_file), exist_ok=True)
+    return write_new_file(keys_file, serialize_phe_keys(public_key, private_key))
+
+def migrate_legacy_phe_keys():
+    """Convert the pickled key pair to the key file and remove the pickle
+    
+    The pickle is trusted here only because it is our own legacy file;
+    it is never read again once converted.
+    """
+    import pickle
+    
+    try:
+        with open(LEGACY_PHE_KEYS_FILE, 'rb') as f:
+            keys = pickle.load(f)
+    except FileNotFoundError:
+        # Another process migrated it in the meantime
+        return
+    
+    save_phe_keys(keys['public'], keys['private'])
+    try:
+        os.remove(LEGACY_PHE_KEYS_FILE)
+    except FileNotFoundError:
+        pass
 
 def initialize_phe_keys():
     """Initialize Paillier key pair"""
     global PUBLIC_KEY, PRIVATE_KEY
     
-    keys_file = '../config/phe_keys.pkl'
+    if not os.path.exists(PHE_KEYS_FILE):
+        if os.path.exists(LEGACY_PHE_KEYS_FILE):
+            migrate_legacy_phe_keys()
+        else:
+            # Generate new keys; if another process got there first, use its keys
+            public_key, private_key = paillier.generate_paillier_keypair()
+            save_phe_keys(public_key, private_key)
     
-    if os.path.exists(keys_file):
-        # Load existing keys
-        with open(keys_file, 'rb') as f:
-            keys = pickle.load(f)
-            PUBLIC_KEY = keys['public']
-            PRIVATE_KEY = keys['private']
-    else:
-        # Generate new keys
-        PUBLIC_KEY, PRIVATE_KEY = paillier.generate_paillier_keypair()
-        
-        # Save keys
-        os.makedirs('../config', exist_ok=True)
-        with open(keys_file, 'wb') as f:
-            pickle.dump({
-                'public': PUBLIC_KEY,
-                'private': PRIVATE_KEY
-            }, f)
+    PUBLIC_KEY, PRIVATE_KEY = load_phe_keys()
+
+def ensure_phe_keys():
+    """Initialize the Paillier key pair once per process (thread-safe)"""
+    if PRIVATE_KEY is not None:
+        return
+    
+    with _phe_keys_lock:
+        if PRIVATE_KEY is None:
+            initialize_phe_keys()
+
+def compute_obfuscator():
+    """A fresh obfuscator r^n mod n^2 for random r < n"""
+    ensure_phe_keys()
+    return powmod(PUBLIC_KEY.get_random_lt_n(), PUBLIC_KEY.n, PUBLIC_KEY.nsquare)
+
+def take_obfuscator():
+    """Draw an obfuscator from the pool, computing one if the pool is empty
+    
+    Every obfuscator is used once: the queue hands each to a single caller.
+    """
+    if _obfuscator_queue is not None:
+        try:
+            return _obfuscator_queue.get_nowait()
+        except queue.Empty:
+            pass
+    
+    return compute_obfuscator()
+
+def fill_obfuscator_queue(n, obfuscator_queue, parent_pid):
+    """Obfuscator worker process: keep the queue full until the parent exits"""
+    if hasattr(os, 'nice'):
+        os.nice(OBFUSCATOR_WORKER_NICE)
+    
+    public_key = paillier.PaillierPublicKey(n)
+    while os.getppid() == parent_pid:
+        obfuscator = powmod(public_key.get_random_lt_n(), n, public_key.nsquare)
+        while os.getppid() == parent_pid:
+            try:
+                obfuscator_queue.put(obfuscator, timeout=5)
+                break
+            except queue.Full:
+                continue
+
+def start_obfuscator_pool(size=DEFAULT_OBFUSCATOR_POOL_SIZE):
+    """Start the obfuscator worker process (no-op if running)"""
+    global _obfuscator_queue, _obfuscator_process
+    
+    if size <= 0:
+        return False
+    
+    # Called before every request: skip the lock while the worker is running
+    process = _obfuscator_process
+    if process and process.is_alive():
+        return False
+    
+    with _obfuscator_pool_lock:
+        if _obfuscator_process and _obfuscator_process.is_alive():
+            return False
+        
+        import multiprocessing
+        
+        ensure_phe_keys()
+        context = multiprocessing.get_context('spawn')
+        _obfuscator_queue = context.Queue(size)
+        _obfuscator_process = context.Process(
+            target=fill_obfuscator_queue,
+            args=(PUBLIC_KEY.n, _obfuscator_queue, os.getpid()),
+            name='phe-obfuscator-pool',
+            daemon=True
+        )
+        _obfuscator_process.start()
+        return True
 
 def encrypt_number(number):
-    """Encrypt a number using Paillier encryption"""
+    """Encrypt a number using Paillier encryption
+    
+    The result is obfuscated with a pooled r^n, so no modular exponentiation
+    is needed here unless the pool has run dry.
+    """
     try:
-        if PUBLIC_KEY is None:
-            initialize_phe_keys()
+        ensure_phe_keys()
         
-        encrypted = PUBLIC_KEY.encrypt(number)
+        encoding = paillier.EncodedNumber.encode(PUBLIC_KEY, number)
+        # r_value=1 gives the bare (n*m + 1) ciphertext; obfuscate it ourselves
+        ciphertext = PUBLIC_KEY.raw_encrypt(encoding.encoding, r_value=1)
+        ciphertext = ciphertext * take_obfuscator() % PUBLIC_KEY.nsquare
+        
+        encrypted = paillier.EncryptedNumber(PUBLIC_KEY, ciphertext, encoding.exponent)
         return encrypted
         
     except Exception as e:
@@ -48,8 +208,7 @@ def encrypt_number(number):
 def decrypt_number(encrypted_number):
     """Decrypt a number using Paillier decryption"""
     try:
-        if PRIVATE_KEY is None:
-            initialize_phe_keys()
+        ensure_phe_keys()
         
         decrypted = PRIVATE_KEY.decrypt(encrypted_number)
         return decrypted
@@ -75,10 +234,15 @@ def encrypt_hash_to_number(hash_string):
         return None
 
 def serialize_encrypted_number(encrypted_number):
-    """Serialize encrypted number for JSON storage"""
+    """Serialize encrypted number for JSON storage
+    
+    Every ciphertext built here is already obfuscated (encrypt_number), and
+    sums of obfuscated ciphertexts stay randomized, so phe's own (unpooled)
+    re-obfuscation is skipped.
+    """
     try:
         return {
-            'ciphertext': str(encrypted_number.ciphertext()),
+            'ciphertext': str(encrypted_number.ciphertext(be_secure=False)),
             'exponent': encrypted_number.exponent
         }
     except Exception as e:
@@ -88,8 +252,7 @@ def serialize_encrypted_number(encrypted_number):
 def deserialize_encrypted_number(serialized):
     """Deserialize encrypted number from JSON"""
     try:
-        if PUBLIC_KEY is None:
-            initialize_phe_keys()
+        ensure_phe_keys()
         
         ciphertext = int(serialized['ciphertext'])
         exponent = serialized['exponent']
@@ -105,8 +268,7 @@ def deserialize_encrypted_number(serialized):
 def encrypt_metadata(metadata, page_hashes):
     """Encrypt metadata and hashes using Paillier"""
     try:
-        if PUBLIC_KEY is None:
-            initialize_phe_keys()
+        ensure_phe_keys()
         
         encrypted_metadata = metadata.copy()
         
@@ -142,8 +304,7 @@ def encrypt_metadata(metadata, page_hashes):
 def decrypt_metadata(encrypted_metadata):
     """Decrypt metadata using Paillier"""
     try:
-        if PRIVATE_KEY is None:
-            initialize_phe_keys()
+        ensure_phe_keys()
         
         decrypted_metadata = encrypted_metadata.copy()
         
@@ -179,43 +340,86 @@ def decrypt_metadata(encrypted_metadata):
         print(f"Error decrypting metadata: {e}")
         return encrypted_metadata
 
-def increment_counter(exam_id, upload_folder):
-    """Homomorphically increment access counter"""
+def add_plaintext(encrypted_number, delta):
+    """Add a plaintext integer to an encrypted number without re-encrypting
+    
+    With g = n + 1, E(m) * (1 + n*delta) = E(m + delta) mod n^2: one
+    multiplication instead of an encryption. The result is not
+    re-randomized; obfuscate it (see rerandomize) before it leaves the process.
+    """
+    public_key = encrypted_number.public_key
+    if encrypted_number.exponent != 0:
+        # Fixed-point values need their exponents aligned; let phe do it
+        return encrypted_number + delta
+    
+    ciphertext = encrypted_number.ciphertext(be_secure=False) * (1 + public_key.n * (delta % public_key.n))
+    return paillier.EncryptedNumber(public_key, ciphertext % public_key.nsquare, 0)
+
+def rerandomize(encrypted_number):
+    """Re-obfuscate an encrypted number with a pooled r^n"""
+    public_key = encrypted_number.public_key
+    ciphertext = encrypted_number.ciphertext(be_secure=False) * take_obfuscator() % public_key.nsquare
+    return paillier.EncryptedNumber(public_key, ciphertext, encrypted_number.exponent)
+
+def increment_counter(exam_id, upload_folder, delta=1, persist=True):
+    """Homomorphically add delta to an exam's access counter
+    
+    With persist=False the increment is only batched in memory; the next
+    persisting call for the exam (or flush_counter_increments) applies all
+    batched increments with one multiplication, re-randomizes the counter
+    once and writes metadata.json once.
+    """
     try:
-        exam_dir = os.path.join(upload_folder, exam_id)
-        metadata_path = os.path.join(exam_dir, 'metadata.json')
-        
-        if not os.path.exists(metadata_path):
-            return False
-        
-        # Load metadata
-        with open(metadata_path, 'r') as f:
-            metadata = json.load(f)
-        
-        # Get encrypted counter
-        if 'phe_access_counter' in metadata:
-            encrypted_counter = deserialize_encrypted_number(metadata['phe_access_counter'])
+        with _counter_lock:
+            key = (upload_folder, exam_id)
+            if not persist:
+                _pending_increments[key] = _pending_increments.get(key, 0) + delta
+                return True
             
-            if encrypted_counter:
-                # Homomorphically add 1
-                incremented_counter = encrypted_counter + encrypt_number(1)
-                
-                # Update metadata
-                metadata['phe_access_counter'] = serialize_encrypted_number(incremented_counter)
-                metadata['last_access'] = datetime.now().isoformat()
-                
-                # Save updated metadata
-                with open(metadata_path, 'w') as f:
-                    json.dump(metadata, f, indent=2)
+            delta += _pending_increments.pop(key, 0)
+            
+            exam_dir = os.path.join(upload_folder, exam_id)
+            metadata_path = os.path.join(exam_dir, 'metadata.json')
+            
+            if not os.path.exists(metadata_path):
+                return False
+            
+            # Load metadata
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
+            
+            # Get encrypted counter
+            if 'phe_access_counter' in metadata:
+                encrypted_counter = deserialize_encrypted_number(metadata['phe_access_counter'])
                 
-                return True
-        
-        return False
-        
+                if encrypted_counter:
+                    # Homomorphically add delta, re-randomizing once for storage
+                    incremented_counter = rerandomize(add_plaintext(encrypted_counter, delta))
+                    
+                    # Update metadata
+                    metadata['phe_access_counter'] = serialize_encrypted_number(incremented_counter)
+                    metadata['last_access'] = datetime.now().isoformat()
+                    
+                    # Save updated metadata
+                    with open(metadata_path, 'w') as f:
+                        json.dump(metadata, f, indent=2)
+                    
+                    return True
+            
+            return False
+    
     except Exception as e:
         print(f"Error incrementing counter: {e}")
         return False
 
+def flush_counter_increments():
+    """Persist every batched access counter increment; returns the exams written"""
+    with _counter_lock:
+        pending = list(_pending_increments)
+        return sum(1 for upload_folder, exam_id in pending if increment_counter(exam_id, upload_folder, 0))
+
+atexit.register(flush_counter_increments)
+
 def get_access_count(exam_id, upload_folder):
     """Get decrypted access count for admin"""
     try:
@@ -228,13 +432,16 @@ def get_access_count(exam_id, upload_folder):
         with open(metadata_path, 'r') as f:
             metadata = json.load(f)
         
+        # Include increments batched in this process but not yet persisted
+        pending = _pending_increments.get((upload_folder, exam_id), 0)
+        
         if 'phe_access_counter' in metadata:
             encrypted_counter = deserialize_encrypted_number(metadata['phe_access_counter'])
             if encrypted_counter:
-                return decrypt_number(encrypted_counter)
-        
-        return 0
+                return decrypt_number(encrypted_counter) + pending
         
+        return pending
+    
     except Exception as e:
         print(f"Error getting access count: {e}")
         return None
@@ -259,7 +466,4 @@ def verify_encrypted_hash(exam_id, page, current_hash, upload_folder):
         
     except Exception as e:
         print(f"Error verifying encrypted hash: {e}")
-        return False
-
-# Initialize keys when module is imported
-initialize_phe_keys()
\ No newline at end of file
+        return False
\ No newline at end of file
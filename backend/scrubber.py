@@ -0,0 +1,238 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from hashing import verify_integrity
+from logs import verify_log_chain
+
+SCRUB_RESULTS_FILE = '../logs/integrity_scrub.json'
+
+# Cross-process locks: one guards read-modify-writes of the results file
+# (any worker may record an on-demand check), the other is held by the one
+# process running the background scrubber so that N workers do not spend
+# N times the I/O budget
+SCRUB_RESULTS_LOCK_FILE = '../logs/integrity_scrub.lock'
+SCRUBBER_LOCK_FILE = '../logs/scrubber.lock'
+
+# Default I/O budget for background verification and pause between passes
+DEFAULT_BYTES_PER_SECOND = 8 * 1024 * 1024
+DEFAULT_PASS_INTERVAL = 15 * 60
+
+# Each pass verifies the audit chain incrementally behind its watermark;
+# a full re-verification from system init runs this often
+FULL_VERIFY_INTERVAL = 24 * 60 * 60
+
+_results_lock = threading.Lock()
+_scrubber_lock = threading.Lock()
+_scrubber_thread = None
+_stop_event = threading.Event()
+
+try:
+    import fcntl
+    
+    def _lock_file(f, blocking=True):
+        """Lock an open file exclusively; returns False if blocking=False and it is held"""
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+    
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+except ImportError:
+    import msvcrt
+    
+    def _lock_file(f, blocking=True):
+        """Lock an open file exclusively; returns False if blocking=False and it is held"""
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+    
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class IOBudget:
+    """Token bucket that sleeps callers to stay under a bytes-per-second budget"""
+    
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self.allowance = bytes_per_second
+        self.last_check = time.monotonic()
+    
+    def __call__(self, nbytes):
+        if not self.bytes_per_second:
+            return
+        
+        now = time.monotonic()
+        self.allowance = min(
+            self.bytes_per_second,
+            self.allowance + (now - self.last_check) * self.bytes_per_second
+        )
+        self.last_check = now
+        self.allowance -= nbytes
+        
+        if self.allowance < 0:
+            time.sleep(-self.allowance / self.bytes_per_second)
+
+def load_scrub_results():
+    """Load the most recent scrub result for every exam"""
+    try:
+        if not os.path.exists(SCRUB_RESULTS_FILE):
+            return {}
+        
+        with open(SCRUB_RESULTS_FILE, 'r') as f:
+            return json.load(f)
+    
+    except Exception as e:
+        print(f"Error loading scrub results: {e}")
+        return {}
+
+def record_scrub_result(exam_id, result):
+    """Store a verification result as the latest scrub result for an exam"""
+    try:
+        os.makedirs(os.path.dirname(SCRUB_RESULTS_FILE), exist_ok=True)
+        
+        with _results_lock, open(SCRUB_RESULTS_LOCK_FILE, 'a+b') as lock:
+            _lock_file(lock)
+            try:
+                results = load_scrub_results()
+                results[exam_id] = dict(result, checked_at=datetime.now().isoformat())
+                
+                # Write to a unique temp file and rename so readers never see a partial file
+                fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(SCRUB_RESULTS_FILE),
+                                                 prefix='integrity_scrub.', suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(results, f, indent=2)
+                os.replace(temp_path, SCRUB_RESULTS_FILE)
+            finally:
+                _unlock_file(lock)
+        
+        return True
+    
+    except Exception as e:
+        print(f"Error recording scrub result: {e}")
+        return False
+
+def get_scrub_result(exam_id):
+    """Get the most recent scrub result for an exam, or None"""
+    return load_scrub_results().get(exam_id)
+
+def get_scrub_order(upload_folder):
+    """List exam ids ordered so the soonest scheduled exams are scrubbed first"""
+    upcoming = []
+    past = []
+    unscheduled = []
+    now = datetime.now()
+    
+    if not os.path.exists(upload_folder):
+        return []
+    
+    for exam_folder in os.listdir(upload_folder):
+        metadata_path = os.path.join(upload_folder, exam_folder, 'metadata.json')
+        if not os.path.exists(metadata_path):
+            continue
+        
+        try:
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
+            scheduled_time = datetime.fromisoformat(metadata['scheduled_time'])
+        except Exception:
+            unscheduled.append(exam_folder)
+            continue
+        
+        if scheduled_time >= now:
+            upcoming.append((scheduled_time - now, exam_folder))
+        else:
+            past.append((now - scheduled_time, exam_folder))
+    
+    upcoming.sort()
+    past.sort()
+    
+    return [exam for _, exam in upcoming] + [exam for _, exam in past] + sorted(unscheduled)
+
+def scrub_exam(exam_id, upload_folder, throttle=None):
+    """Verify one exam's pages and record the result"""
+    result = verify_integrity(exam_id, upload_folder, throttle)
+    record_scrub_result(exam_id, result)
+    return result
+
+def scrub_pass(upload_folder, bytes_per_second=DEFAULT_BYTES_PER_SECOND):
+    """Run one full scrub pass over every exam, in priority order"""
+    budget = IOBudget(bytes_per_second)
+    scrubbed = 0
+    
+    for exam_id in get_scrub_order(upload_folder):
+        if _stop_event.is_set():
+            break
+        
+        scrub_exam(exam_id, upload_folder, budget)
+        scrubbed += 1
+    
+    return scrubbed
+
+def _scrub_loop(upload_folder, bytes_per_second, interval):
+    """Background loop: scrub all exams and the audit chain, then wait for the next pass
+    
+    Only the process holding the scrubber lock scrubs. The others retry
+    every interval, so one of them takes over if that process exits.
+    """
+    os.makedirs(os.path.dirname(SCRUBBER_LOCK_FILE), exist_ok=True)
+    
+    with open(SCRUBBER_LOCK_FILE, 'a+b') as lock:
+        while not _lock_file(lock, blocking=False):
+            if _stop_event.wait(interval):
+                return
+        
+        last_full_verify = None
+        while not _stop_event.is_set():
+            try:
+                scrub_pass(upload_folder, bytes_per_second)
+                
+                if not _stop_event.is_set():
+                    # Scheduled full re-verification, otherwise only what was appended
+                    full = last_full_verify is None or time.monotonic() - last_full_verify >= FULL_VERIFY_INTERVAL
+                    if full:
+                        last_full_verify = time.monotonic()
+                    if not verify_log_chain(full=full):
+                        print(f"Audit log chain failed {'full' if full else 'incremental'} verification")
+            except Exception as e:
+                print(f"Error during integrity scrub: {e}")
+            
+            _stop_event.wait(interval)
+
+def start_scrubber(upload_folder, bytes_per_second=DEFAULT_BYTES_PER_SECOND, interval=DEFAULT_PASS_INTERVAL):
+    """Start the background integrity scrubber (no-op if already running)"""
+    global _scrubber_thread
+    
+    if _scrubber_thread and _scrubber_thread.is_alive():
+        return False
+    
+    with _scrubber_lock:
+        if _scrubber_thread and _scrubber_thread.is_alive():
+            return False
+        
+        _stop_event.clear()
+        _scrubber_thread = threading.Thread(
+            target=_scrub_loop,
+            args=(upload_folder, bytes_per_second, interval),
+            name='integrity-scrubber',
+            daemon=True
+        )
+        _scrubber_thread.start()
+        return True
+
+def stop_scrubber(timeout=None):
+    """Stop the background integrity scrubber"""
+    _stop_event.set()
+    if _scrubber_thread:
+        _scrubber_thread.join(timeout)
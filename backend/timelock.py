@@ -2,6 +2,9 @@ from datetime import datetime, timedelta
 import json
 import os
 
+# How long an exam runs after its scheduled release time
+EXAM_DURATION_HOURS = 3
+
 def check_release_time(scheduled_time_str):
     """Check if it's time to release the chaos key"""
     try:
@@ -79,7 +82,11 @@ def get_time_until_release(scheduled_time_str):
             'error': f"Error calculating time until release: {e}"
         }
 
-def is_exam_active(exam_id, upload_folder, duration_hours=3):
+def get_exam_end_time(scheduled_time_str, duration_hours=EXAM_DURATION_HOURS):
+    """End of the exam window that opens at the scheduled release time"""
+    return datetime.fromisoformat(scheduled_time_str) + timedelta(hours=duration_hours)
+
+def is_exam_active(exam_id, upload_folder, duration_hours=EXAM_DURATION_HOURS):
     """Check if exam is currently active (within exam duration)"""
     try:
         exam_dir = os.path.join(upload_folder, exam_id)
@@ -97,7 +104,7 @@ def is_exam_active(exam_id, upload_folder, duration_hours=3):
         
         scheduled_time = datetime.fromisoformat(scheduled_time_str)
         current_time = datetime.now()
-        exam_end_time = scheduled_time + timedelta(hours=duration_hours)
+        exam_end_time = get_exam_end_time(scheduled_time_str, duration_hours)
         
         # Exam is active if current time is between scheduled time and end time
         is_active = scheduled_time <= current_time <= exam_end_time
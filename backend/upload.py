@@ -4,8 +4,9 @@ from datetime import datetime
 from werkzeug.utils import secure_filename
 from PIL import Image
 from pdf2image import convert_from_path
-from chaotic import generate_chaos_key, scramble_image, save_encrypted_chaos_key
-from hashing import compute_sha256
+from chaotic import generate_chaos_key, scramble_image_with_digest, save_encrypted_chaos_key
+from hashing import (compute_file_digest, write_integrity_manifest, DEFAULT_DIGEST_ALGORITHM,
+                     INTEGRITY_MANIFEST, LEGACY_INTEGRITY_FILE)
 from phe_wrapper import encrypt_metadata
 
 ALLOWED_EXTENSIONS = {'pdf', 'docx', 'png', 'jpg', 'jpeg'}
@@ -103,20 +104,24 @@ def process_upload(file, exam_id, uploader, scheduled_time, upload_folder):
         # Scramble each image and compute hashes
         scrambled_images = []
         page_hashes = {}
+        pixel_digests = {}
         
         for i, img_path in enumerate(original_images):
             # Scramble image
             scrambled_path = os.path.join(exam_dir, f'scrambled_page_{i + 1}.png')
-            success, message = scramble_image(img_path, chaos_key, scrambled_path)
+            success, message, pixel_digest = scramble_image_with_digest(
+                img_path, chaos_key, scrambled_path, DEFAULT_DIGEST_ALGORITHM
+            )
             
             if not success:
                 return {'success': False, 'error': f'Scrambling failed: {message}'}
             
             scrambled_images.append(scrambled_path)
             
-            # Compute SHA-256 hash of scrambled image
-            page_hash = compute_sha256(scrambled_path)
+            # Compute digest of scrambled image
+            page_hash = compute_file_digest(scrambled_path, DEFAULT_DIGEST_ALGORITHM)
             page_hashes[f'page_{i + 1}'] = page_hash
+            pixel_digests[f'page_{i + 1}'] = pixel_digest
         
         # Save encrypted chaos key
         chaos_key_path = os.path.join(exam_dir, 'chaos_key.enc')
@@ -131,7 +136,8 @@ def process_upload(file, exam_id, uploader, scheduled_time, upload_folder):
             'scheduled_time': scheduled_time,
             'total_pages': len(original_images),
             'key_released': False,
-            'release_time': None
+            'release_time': None,
+            'hash_algorithm': DEFAULT_DIGEST_ALGORITHM
         }
         
         # Encrypt metadata using Paillier
@@ -142,11 +148,9 @@ def process_upload(file, exam_id, uploader, scheduled_time, upload_folder):
         with open(metadata_path, 'w') as f:
             json.dump(encrypted_metadata, f, indent=2)
         
-        # Save plain hashes for integrity verification
-        integrity_path = os.path.join(exam_dir, 'integrity.sha256')
-        with open(integrity_path, 'w') as f:
-            for page, hash_val in page_hashes.items():
-                f.write(f"{page}: {hash_val}\n")
+        # Save versioned integrity manifest for verification
+        if not write_integrity_manifest(exam_dir, page_hashes, DEFAULT_DIGEST_ALGORITHM, pixel_digests):
+            return {'success': False, 'error': 'Failed to save integrity manifest'}
         
         # Clean up temp directory
         import shutil
@@ -186,7 +190,8 @@ def get_upload_info(exam_id, upload_folder):
             'metadata': metadata,
             'scrambled_images_count': scrambled_count,
             'chaos_key_exists': os.path.exists(os.path.join(exam_dir, 'chaos_key.enc')),
-            'integrity_file_exists': os.path.exists(os.path.join(exam_dir, 'integrity.sha256'))
+            'integrity_file_exists': os.path.exists(os.path.join(exam_dir, INTEGRITY_MANIFEST)) or
+                                     os.path.exists(os.path.join(exam_dir, LEGACY_INTEGRITY_FILE))
         }
         
     except Exception as e:
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark cold import time of the backend modules (python -X importtime)
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+
+DEFAULT_MODULES = ['phe_wrapper', 'logs', 'chaotic', 'examcenter', 'upload', 'app']
+
+def parse_importtime(stderr):
+    """Parse -X importtime output into {module: (self_us, cumulative_us)}"""
+    times = {}
+
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+
+    return times
+
+def files_under(root):
+    """Set of regular files below a directory"""
+    return {os.path.join(path, file) for path, _, files in os.walk(root) for file in files}
+
+def import_once(module):
+    """Import a module in a fresh interpreter inside an empty project tree
+
+    Returns (import times, files the import wrote). '../logs', '../config'
+    and the other data paths resolve inside the temp dir, so any import-time
+    initialization shows up as written files.
+    """
+    temp_root = tempfile.mkdtemp(prefix='edusecure_import_')
+    work_dir = os.path.join(temp_root, 'backend')
+    os.makedirs(work_dir)
+
+    try:
+        env = dict(os.environ, PYTHONPATH=BACKEND_DIR, PYTHONDONTWRITEBYTECODE='1')
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=work_dir, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+        written = sorted(os.path.relpath(path, temp_root) for path in files_under(temp_root))
+        return parse_importtime(result.stderr), written
+
+    finally:
+        shutil.rmtree(temp_root, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark cold import time of the backend')
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES,
+                        help=f"Modules to import (default: {' '.join(DEFAULT_MODULES)})")
+    parser.add_argument('--rounds', type=int, default=5, help='Imports per module, best is reported (default: 5)')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Slowest imports (self time) to list for the last module (default: 10)')
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help='Fail if any module takes longer than this to import')
+    args = parser.parse_args()
+
+    print("EduSecure Import-Time Benchmark")
+    print("=" * 40)
+    print(f"Python {sys.version.split()[0]}, best of {args.rounds} cold imports\n")
+    print(f"{'Module':<16}{'Import (ms)':>12}  Files written on import")
+    print("-" * 60)
+
+    passed = True
+    times = {}
+    for module in args.modules:
+        best = None
+        for _ in range(args.rounds):
+            times, written = import_once(module)
+            cumulative = times[module][1] / 1000
+            if best is None or cumulative < best:
+                best = cumulative
+
+        over_budget = args.budget_ms is not None and best > args.budget_ms
+        passed &= not written and not over_budget
+        print(f"{module:<16}{best:>12.1f}  {', '.join(written) if written else 'none'}"
+              + ("  (over budget)" if over_budget else ""))
+
+    if args.top and times:
+        print(f"\nSlowest imports under '{args.modules[-1]}' (self time):")
+        slowest = sorted(times.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+        for name, (self_us, cumulative_us) in slowest:
+            print(f"  {name:<40}{self_us / 1000:>8.1f} ms (cumulative {cumulative_us / 1000:.1f} ms)")
+
+    print("\nPASS" if passed else "\nFAIL")
+    return 0 if passed else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -293,32 +293,39 @@ def demo_tamper_proof_logging():
     # Demonstrate tampering detection
     print("\n   🚨 Demonstrating log tampering detection:")
     
-    logs_file = '../logs/logs.json'
+    # Active segment of the demo exam's chain: a header line followed by one
+    # JSON entry per line
+    import logstore
+    chain = logstore.chain_for('demo_exam_001')
+    logs_file = logstore.segment_path(logstore.get_tail(chain)['segment'], chain=chain)
     if os.path.exists(logs_file):
-        # Read logs
         with open(logs_file, 'r') as f:
-            logs = json.load(f)
+            lines = f.readlines()
         
         # Tamper with a log entry
-        if len(logs) > 1:
-            original_details = logs[1]['details']
-            logs[1]['details'] = 'TAMPERED LOG ENTRY'
+        if len(lines) > 2:
+            entry = json.loads(lines[1])
+            original_line = lines[1]
+            original_details = entry['details']
+            entry['details'] = 'TAMPERED LOG ENTRY'
+            lines[1] = json.dumps(entry, separators=(',', ':')) + '\n'
             
             # Save tampered logs
             with open(logs_file, 'w') as f:
-                json.dump(logs, f, indent=2)
+                f.writelines(lines)
             
             print(f"   🔧 Tampered with log entry: '{original_details}' → 'TAMPERED LOG ENTRY'")
             
-            # Verify chain again
-            tampered_valid = verify_log_chain()
+            # Verify chain again (full re-verification, since the tampered
+            # entry is behind the incremental verification watermark)
+            tampered_valid = verify_log_chain(full=True)
             if not tampered_valid:
                 print("   🚨 TAMPERING DETECTED! Log chain integrity compromised")
             
             # Restore original
-            logs[1]['details'] = original_details
+            lines[1] = original_line
             with open(logs_file, 'w') as f:
-                json.dump(logs, f, indent=2)
+                f.writelines(lines)
             print("   🔧 Log restored to original state")
     
     return True
@@ -381,7 +388,7 @@ def generate_demo_report():
             'demo_output/chaos_key.enc',
             'demo_output/metadata.json',
             'demo_output/integrity.sha256',
-            '../logs/logs.json'
+            '../logs/segments/'
         ],
         'cryptographic_operations': {
             'pixel_scrambling': 'SUCCESS',
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Rotate the admin RSA key and master KEK, re-wrapping every exam's chaos key
+"""
+import os
+import sys
+import time
+import glob
+import shutil
+import secrets
+import argparse
+import tempfile
+import multiprocessing
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+sys.path.append(BACKEND_DIR)
+
+import chaotic
+import fileutil
+from Crypto.PublicKey import RSA
+
+# State of a rotation in progress: the name of the new key set (written to
+# its own directory under chaotic.KEY_SETS_DIR) and the exams re-wrapped so far
+ROTATION_DIR = os.path.join(chaotic.RSA_KEYS_DIR, 'rotation')
+STAGED_KEY_SET_FILE = os.path.join(ROTATION_DIR, 'key_set')
+CHECKPOINT_FILE = os.path.join(ROTATION_DIR, 'checkpoint.txt')
+
+# Keys held by each worker process: old private key, old KEK, new KEK
+_worker_keys = None
+# Why init_worker failed; rotate_exam reports it instead of the pool respawning the worker
+_worker_error = None
+
+def load_private_key(path):
+    """Read an RSA private key, or None if the file does not exist"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return RSA.import_key(f.read())
+
+def staged_key_set_dir():
+    """Directory of the key set being rotated to, or None if no rotation is in progress"""
+    if not os.path.exists(STAGED_KEY_SET_FILE):
+        return None
+    with open(STAGED_KEY_SET_FILE, 'r') as f:
+        return chaotic.key_set_dir(f.read().strip())
+
+def prepare_rotation():
+    """Write a new key set (reused when resuming); returns True if resuming
+
+    The RSA key pair and KEK are written to a temp directory that is renamed
+    into place, so a crash never leaves a private key without its KEK.
+    """
+    if staged_key_set_dir():
+        return True
+
+    # Leftovers of an interrupted staging: nothing in them was ever used
+    shutil.rmtree(ROTATION_DIR, ignore_errors=True)
+    for leftover in glob.glob(os.path.join(chaotic.KEY_SETS_DIR, '*.tmp')):
+        shutil.rmtree(leftover, ignore_errors=True)
+
+    os.makedirs(chaotic.KEY_SETS_DIR, exist_ok=True)
+    key_set = f"{time.strftime('%Y%m%d')}-{secrets.token_hex(4)}"
+    staging_dir = tempfile.mkdtemp(prefix=key_set + '.', suffix='.tmp', dir=chaotic.KEY_SETS_DIR)
+    private_key = RSA.generate(2048)
+    fileutil.write_new_file(os.path.join(staging_dir, chaotic.RSA_PRIVATE_KEY_FILE_NAME),
+                           private_key.export_key())
+    fileutil.write_new_file(os.path.join(staging_dir, chaotic.RSA_PUBLIC_KEY_FILE_NAME),
+                           private_key.publickey().export_key())
+    chaotic.create_master_kek(os.path.join(staging_dir, chaotic.MASTER_KEK_FILE_NAME),
+                              private_key.publickey())
+    os.rename(staging_dir, chaotic.key_set_dir(key_set))
+
+    os.makedirs(ROTATION_DIR)
+    fileutil.replace_file(STAGED_KEY_SET_FILE, key_set.encode())
+    return False
+
+def load_rotation_keys():
+    """Unwrap the old and new KEKs: (old private key, old KEK, new KEK)
+
+    The old keys are None once the new key set is current; chaos keys still
+    sealed under an earlier KEK are then opened through its retired key set.
+    """
+    old_dir = chaotic.current_key_set_dir()
+    new_dir = staged_key_set_dir()
+
+    old_private_key = None
+    old_master_kek = None
+    if old_dir != new_dir:
+        old_private_key = load_private_key(os.path.join(old_dir, chaotic.RSA_PRIVATE_KEY_FILE_NAME))
+        old_kek_file = os.path.join(old_dir, chaotic.MASTER_KEK_FILE_NAME)
+        if old_private_key and os.path.exists(old_kek_file):
+            old_master_kek = chaotic.load_master_kek(old_kek_file, old_private_key)
+
+    new_master_kek = chaotic.load_master_kek(os.path.join(new_dir, chaotic.MASTER_KEK_FILE_NAME))
+    return old_private_key, old_master_kek, new_master_kek
+
+def init_worker():
+    """Unwrap the old and new KEKs once per worker process
+
+    Errors are kept rather than raised: a pool initializer that raises is
+    restarted forever.
+    """
+    global _worker_keys, _worker_error
+
+    try:
+        _worker_keys = load_rotation_keys()
+    except Exception as e:
+        _worker_error = f"cannot load rotation keys: {e}"
+
+def rotate_exam(file_path):
+    """Re-wrap one exam's chaos key under the new KEK; returns (status, path, error)"""
+    if _worker_error:
+        return 'failed', file_path, _worker_error
+
+    old_private_key, old_master_kek, new_master_kek = _worker_keys
+    try:
+        with open(file_path, 'rb') as f:
+            encrypted_key = f.read()
+
+        rewrapped = chaotic.rewrap_chaos_key(encrypted_key, old_private_key, old_master_kek, new_master_kek)
+        if rewrapped is None:
+            return 'skipped', file_path, None
+
+        # Never replace a readable key with one that does not decrypt
+        if chaotic.decrypt_chaos_key(rewrapped, new_master_kek) is None:
+            return 'failed', file_path, 're-wrapped key does not decrypt'
+
+        fileutil.replace_file(file_path, rewrapped)
+        return 'rotated', file_path, None
+
+    except Exception as e:
+        return 'failed', file_path, str(e)
+
+def find_chaos_keys(papers_dir):
+    """Collect the chaos key file of every exam under the papers directory"""
+    paths = []
+
+    if not os.path.exists(papers_dir):
+        return paths
+
+    for exam_folder in sorted(os.listdir(papers_dir)):
+        path = os.path.join(papers_dir, exam_folder, chaotic.CHAOS_KEY_FILE_NAME)
+        if os.path.exists(path):
+            paths.append(path)
+
+    return paths
+
+def load_checkpoint():
+    """Chaos key files already re-wrapped by an interrupted run"""
+    if not os.path.exists(CHECKPOINT_FILE):
+        return set()
+    with open(CHECKPOINT_FILE, 'r') as f:
+        return {line.rstrip('\n') for line in f if line.endswith('\n')}
+
+def switch_key_set(new_dir):
+    """Make the new key set current with a single rename of the pointer file"""
+    fileutil.replace_file(chaotic.CURRENT_KEY_SET_FILE, os.path.basename(new_dir).encode())
+
+def rewrap_all(pool, paths, chunk_size, checkpoint=None):
+    """Re-wrap chaos keys in the pool; returns the count per status"""
+    counts = {'rotated': 0, 'skipped': 0, 'failed': 0}
+
+    for status, path, error in pool.imap_unordered(rotate_exam, paths, chunk_size):
+        counts[status] += 1
+        if error:
+            print(f"Failed: {path}: {error}")
+        elif checkpoint:
+            checkpoint.write(path + '\n')
+            checkpoint.flush()
+
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description='Rotate the admin RSA key and re-wrap all chaos keys')
+    parser.add_argument('--papers-dir', default=chaotic.PAPERS_DIR,
+                        help='Papers directory, relative to backend/ (default: ../papers)')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                        help='Worker processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=16, help='Exams handed to a worker at a time (default: 16)')
+    args = parser.parse_args()
+
+    print("EduSecure Key Rotation")
+    print("=" * 40)
+
+    # Key and paper paths are relative to the backend directory
+    os.chdir(BACKEND_DIR)
+
+    old_dir = chaotic.current_key_set_dir()
+    if not staged_key_set_dir() and not os.path.exists(os.path.join(old_dir, chaotic.RSA_PRIVATE_KEY_FILE_NAME)):
+        print("No admin RSA key in config/, nothing to rotate")
+        return 1
+
+    resuming = prepare_rotation()
+    new_dir = staged_key_set_dir()
+    # Check the keys once here so a broken staging fails before any worker starts
+    try:
+        load_rotation_keys()
+    except Exception as e:
+        print(f"Cannot load rotation keys: {e}")
+        print(f"Remove {ROTATION_DIR} to restart the rotation with fresh keys")
+        return 1
+
+    switched = old_dir == new_dir
+    done = load_checkpoint()
+    pending = [] if switched else [path for path in find_chaos_keys(args.papers_dir) if path not in done]
+    print(("Resuming rotation" if resuming else "Started rotation") +
+          f": {len(done)} exam(s) already done, {len(pending)} to go")
+
+    context = multiprocessing.get_context('spawn')
+    start = time.perf_counter()
+
+    with context.Pool(args.processes, initializer=init_worker) as pool:
+        with open(CHECKPOINT_FILE, 'a') as checkpoint:
+            counts = rewrap_all(pool, pending, args.chunk_size, checkpoint)
+            os.fsync(checkpoint.fileno())
+
+        elapsed = time.perf_counter() - start
+        processed = counts['rotated'] + counts['skipped'] + counts['failed']
+        print(f"Processes: {args.processes}")
+        print(f"Rotated: {counts['rotated']}, already rotated: {counts['skipped']}, failed: {counts['failed']}")
+        print(f"Elapsed: {elapsed:.2f}s ({processed / elapsed if elapsed else 0:.0f} exams/s)")
+
+        if counts['failed']:
+            print("Old keys kept in place; fix the failures and re-run to resume")
+            return 1
+
+        if not switched:
+            switch_key_set(new_dir)
+            print("New admin RSA key and master KEK are in place")
+
+        # Uploads during the rotation sealed their keys under the old KEK;
+        # those stay readable through the old key set and are re-wrapped here
+        counts = rewrap_all(pool, find_chaos_keys(args.papers_dir), args.chunk_size)
+        print(f"Re-wrapped {counts['rotated']} key(s) written during the rotation, failed: {counts['failed']}")
+
+    if counts['failed']:
+        print("Fix the failures and re-run to finish the rotation")
+        return 1
+
+    shutil.rmtree(ROTATION_DIR)
+    if old_dir != new_dir:
+        print(f"Previous keys kept in {old_dir}; chaos keys sealed under them stay readable")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
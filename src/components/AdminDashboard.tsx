@@ -19,6 +19,8 @@ import {
   Loader2
 } from 'lucide-react';
 
+const LOG_PAGE_SIZE = 10;
+
 interface AdminDashboardProps {
   username: string;
   onLogout: () => void;
@@ -27,6 +29,9 @@ interface AdminDashboardProps {
 const AdminDashboard = ({ username, onLogout }: AdminDashboardProps) => {
   const [examPapers, setExamPapers] = useState<any[]>([]);
   const [systemLogs, setSystemLogs] = useState<any[]>([]);
+  const [logCursor, setLogCursor] = useState<string | null>(null);
+  const [logTotal, setLogTotal] = useState(0);
+  const [loadingMoreLogs, setLoadingMoreLogs] = useState(false);
   const [loading, setLoading] = useState(true);
   const [keyReleasing, setKeyReleasing] = useState<string | null>(null);
   const { toast } = useToast();
@@ -49,14 +54,16 @@ const AdminDashboard = ({ username, onLogout }: AdminDashboardProps) => {
         setExamPapers(papersData.papers || []);
       }
 
-      // Fetch logs
-      const logsResponse = await fetch('http://localhost:5000/api/admin/logs', {
+      // Fetch the most recent page of logs
+      const logsResponse = await fetch(`http://localhost:5000/api/admin/logs?limit=${LOG_PAGE_SIZE}&order=newest`, {
         credentials: 'include'
       });
       
       if (logsResponse.ok) {
         const logsData = await logsResponse.json();
         setSystemLogs(logsData.logs || []);
+        setLogCursor(logsData.next_cursor || null);
+        setLogTotal(logsData.total_entries || 0);
       }
       
     } catch (error) {
@@ -70,6 +77,33 @@ const AdminDashboard = ({ username, onLogout }: AdminDashboardProps) => {
     }
   };
 
+  const loadMoreLogs = async () => {
+    if (!logCursor) return;
+    
+    try {
+      setLoadingMoreLogs(true);
+      
+      const response = await fetch(
+        `http://localhost:5000/api/admin/logs?limit=${LOG_PAGE_SIZE}&order=newest&after=${encodeURIComponent(logCursor)}`,
+        { credentials: 'include' }
+      );
+      
+      if (response.ok) {
+        const data = await response.json();
+        setSystemLogs((logs) => [...logs, ...(data.logs || [])]);
+        setLogCursor(data.next_cursor || null);
+      }
+    } catch (error) {
+      toast({
+        title: "Error",
+        description: "Failed to load more logs",
+        variant: "destructive"
+      });
+    } finally {
+      setLoadingMoreLogs(false);
+    }
+  };
+
   const handleReleaseKey = async (examId: string) => {
     try {
       setKeyReleasing(examId);
@@ -204,7 +238,7 @@ const AdminDashboard = ({ username, onLogout }: AdminDashboardProps) => {
               <div className="flex items-center justify-between">
                 <div>
                   <p className="text-sm font-medium text-muted-foreground">Log Entries</p>
-                  <p className="text-2xl font-bold text-foreground">{systemLogs.length}</p>
+                  <p className="text-2xl font-bold text-foreground">{logTotal}</p>
                 </div>
                 <Activity className="h-8 w-8 text-destructive" />
               </div>
@@ -360,8 +394,8 @@ const AdminDashboard = ({ username, onLogout }: AdminDashboardProps) => {
                   </div>
                 ) : (
                   <div className="space-y-2">
-                    {systemLogs.slice(-10).reverse().map((log) => (
-                      <div key={log.id} className="flex items-center justify-between p-3 border border-border rounded-lg bg-card/30">
+                    {systemLogs.map((log) => (
+                      <div key={`${log.chain}-${log.id}`} className="flex items-center justify-between p-3 border border-border rounded-lg bg-card/30">
                         <div className="flex items-center gap-4">
                           <div className="w-2 h-2 rounded-full bg-accent"></div>
                           <div>
@@ -382,6 +416,16 @@ const AdminDashboard = ({ username, onLogout }: AdminDashboardProps) => {
                         </div>
                       </div>
                     ))}
+                    {logCursor && (
+                      <Button
+                        variant="outline"
+                        className="w-full"
+                        onClick={loadMoreLogs}
+                        disabled={loadingMoreLogs}
+                      >
+                        {loadingMoreLogs ? <Loader2 className="h-4 w-4 animate-spin" /> : 'Load older logs'}
+                      </Button>
+                    )}
                   </div>
                 )}
               </CardContent>
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Stress test: many processes appending to one audit log concurrently
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+sys.path.append(BACKEND_DIR)
+
+def writer_process(worker, appends, segment_bytes, exams):
+    """Append `appends` events from one process, mixing waited and fire-and-forget
+    appends and spreading them over the system chain and `exams` exam chains"""
+    import logstore
+    import logs
+
+    logstore.SEGMENT_MAX_BYTES = segment_bytes
+
+    for i in range(appends):
+        slot = (worker + i) % (exams + 1)
+        exam_id = f"stress_exam_{slot}" if slot else None
+        success, _ = logs.append_log('stress', f'worker{worker}', exam_id, f"append {i}", wait=(i % 2 == 0))
+        if not success:
+            return False
+
+    # Flush fire-and-forget appends (and anchor the exam chains) before exiting
+    logstore.stop_writer()
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent multi-process log append stress test')
+    parser.add_argument('--processes', type=int, default=8, help='Writer processes (default: 8)')
+    parser.add_argument('--appends', type=int, default=500, help='Appends per process (default: 500)')
+    parser.add_argument('--segment-bytes', type=int, default=64 * 1024,
+                        help='Segment size limit, small to force rotations (default: 64 KiB)')
+    parser.add_argument('--exams', type=int, default=4, help='Exam chains to spread appends over (default: 4)')
+    args = parser.parse_args()
+
+    print("EduSecure Multi-Process Log Stress Test")
+    print("=" * 40)
+
+    # Run against a throwaway log: '../logs' resolves inside the temp dir
+    temp_root = tempfile.mkdtemp(prefix='edusecure_stress_')
+    work_dir = os.path.join(temp_root, 'backend')
+    os.makedirs(work_dir)
+    os.chdir(work_dir)
+
+    try:
+        # Spawned workers are separate interpreters, like gunicorn workers
+        context = multiprocessing.get_context('spawn')
+        start = time.perf_counter()
+        with context.Pool(args.processes) as pool:
+            results = pool.starmap(
+                writer_process,
+                [(worker, args.appends, args.segment_bytes, args.exams) for worker in range(args.processes)]
+            )
+        elapsed = time.perf_counter() - start
+
+        import logstore
+        import logs
+
+        chains = logstore.list_chains()
+        entries = 0
+        anchors = 0
+        init_entries = 0
+        ids_contiguous = True
+        for chain in chains:
+            chain_entries = logstore.read_all_entries(chain)
+            ids_contiguous &= [entry['id'] for entry in chain_entries] == list(range(1, len(chain_entries) + 1))
+            for entry in chain_entries:
+                if entry['event'] == logstore.ANCHOR_EVENT:
+                    anchors += 1
+                elif entry['event'] == 'system_init':
+                    init_entries += 1
+                else:
+                    entries += 1
+
+        expected = args.processes * args.appends
+        chain_valid, first_broken_id, broken_chain = logs.full_verify_log_chain()
+
+        print(f"Processes: {args.processes}, appends per process: {args.appends}")
+        print(f"Elapsed: {elapsed:.2f}s ({expected / elapsed:.0f} appends/s)")
+        print(f"Chains: {len(chains)}, segments: {sum(len(logstore.list_segments(chain)) for chain in chains)}")
+        print(f"Entries: {entries} (expected {expected}), anchors: {anchors}")
+        print(f"Contiguous ids per chain: {ids_contiguous}")
+        print(f"system_init entries: {init_entries}")
+        print(f"Chains and anchors valid: {chain_valid}" +
+              (f" (broken at entry {first_broken_id} of {broken_chain})" if not chain_valid else ""))
+
+        passed = (all(results) and entries == expected and ids_contiguous
+                  and init_entries == 1 and chain_valid)
+        print("PASS" if passed else "FAIL")
+        return 0 if passed else 1
+
+    finally:
+        os.chdir(os.path.dirname(BACKEND_DIR))
+        shutil.rmtree(temp_root, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())